@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of XML backends on large synthetic 'show disks' and 'show volumes' responses.
+
+Compares the old way (stdlib parser and find() call with XPath string for every property) with
+the stdlib and lxml backends of zbx-hpmsa and checks that all of them give identical output.
+
+Usage: python3 benchmarks/xml_parser.py [--disks 480] [--volumes 1024] [--repeat 5]
+"""
+
+import os
+import json
+import importlib.util
+from timeit import repeat
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+from xml.etree import ElementTree as eTree
+
+# zbx-hpmsa.py can't be imported with 'import' because of dash in its name
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'zbx-hpmsa.py')
+spec = importlib.util.spec_from_file_location('zbx_hpmsa', SCRIPT)
+zbx = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(zbx)
+
+# Real MSA 2040 'drive' and 'volume' objects have about 90 and 60 properties
+DISK_PROPS = ['durable-id', 'enclosure-id', 'drawer-id', 'slot', 'location', 'url', 'port', 'scsi-id', 'blocksize',
+              'blocks', 'serial-number', 'vendor', 'model', 'revision', 'secondary-channel', 'container-index',
+              'member-index', 'description', 'architecture', 'interface', 'single-ported', 'type', 'usage', 'job-running',
+              'state', 'current-job-completion', 'blink', 'locator-led', 'speed', 'smart', 'dual-port', 'error',
+              'fc-p1-channel', 'fc-p1-device-id', 'fc-p1-node-wwn', 'fc-p1-port-wwn', 'fc-p1-unit-number',
+              'fc-p2-channel', 'fc-p2-device-id', 'fc-p2-node-wwn', 'fc-p2-port-wwn', 'fc-p2-unit-number',
+              'drive-down-code', 'owner', 'index', 'rpm', 'size', 'size-numeric', 'sector-format', 'transfer-rate',
+              'attributes', 'enclosure-wwn', 'status', 'recon-state', 'copyback-state', 'virtual-disk-serial',
+              'disk-group', 'storage-pool-name', 'storage-tier', 'ssd-life-left', 'led-status', 'disk-dsd-count',
+              'spun-down', 'number-of-ios', 'total-data-transferred', 'avg-rsp-time', 'fde-state', 'lock-key-id',
+              'import-lock-key-id', 'fde-config-time', 'temperature', 'temperature-numeric', 'temperature-status',
+              'pi-formatted', 'power-on-hours', 'extended-status', 'health', 'health-numeric', 'health-reason',
+              'health-recommendation']
+VOLUME_PROPS = ['durable-id', 'virtual-disk-name', 'storage-pool-name', 'volume-name', 'size', 'size-numeric',
+                'total-size', 'total-size-numeric', 'allocated-size', 'allocated-size-numeric', 'storage-type',
+                'preferred-owner', 'preferred-owner-numeric', 'owner', 'owner-numeric', 'serial-number',
+                'write-policy', 'cache-optimization', 'read-ahead-size', 'volume-type', 'volume-class', 'tier-affinity',
+                'snapshot', 'snapshot-retention-priority', 'volume-qualifier', 'blocksize', 'blocks', 'capabilities',
+                'volume-parent', 'snap-pool', 'replication-set', 'attributes', 'virtual-disk-serial', 'volume-description',
+                'wwn', 'progress', 'progress-numeric', 'container-name', 'container-serial', 'allowed-storage-tiers',
+                'threshold-percent-of-pool', 'reserved-size-in-pages', 'allocate-reserved-pages-first',
+                'zero-init-page-on-allocation', 'large-virtual-extents', 'raidtype', 'pi-format', 'cs-replication-role',
+                'cs-copy-dest', 'cs-copy-src', 'cs-primary', 'cs-secondary', 'health', 'health-numeric',
+                'health-reason', 'health-recommendation', 'volume-group', 'group-key']
+
+
+def make_doc(obj_name, basetype, props, count, values):
+    """
+    Make synthetic MSA response with 'count' objects.
+    """
+
+    objects = []
+    for i in range(count):
+        prop_values = dict((prop, 'value-{}'.format(prop)) for prop in props)
+        prop_values.update(values(i))
+        objects.append('<OBJECT basetype="{}" name="{}" oid="{}" format="rows">{}</OBJECT>'.format(
+            basetype, obj_name, i + 1,
+            ''.join('<PROPERTY name="{}" type="string" size="32" draw="true" sort="string" display-name="{}">{}'
+                    '</PROPERTY>'.format(prop, prop.title(), value) for prop, value in prop_values.items())))
+    status = ('<OBJECT basetype="status" name="status" oid="{}"><PROPERTY name="response-type">Success</PROPERTY>'
+              '<PROPERTY name="response">Command completed successfully.</PROPERTY>'
+              '<PROPERTY name="return-code">0</PROPERTY></OBJECT>').format(count + 1)
+    return '<?xml version="1.0" encoding="UTF-8"?><RESPONSE VERSION="L100">{}{}</RESPONSE>'.format(
+        ''.join(objects), status).encode()
+
+
+def old_disks(xml):
+    """
+    'lld disks' and health of all disks like zbx-hpmsa did it before XML backends: find() for every property.
+    """
+
+    lld, health = [], {}
+    for disk in xml.findall("./OBJECT[@name='drive']"):
+        disk_id = disk.find("./PROPERTY[@name='location']").text
+        disk_sn = disk.find("./PROPERTY[@name='serial-number']").text
+        lld.append({"{#DISK.ID}": "{}".format(disk_id), "{#DISK.SN}": "{}".format(disk_sn)})
+    for disk in xml.findall("./OBJECT[@name='drive']"):
+        health[disk.find("./PROPERTY[@name='location']").text] = disk.find("./PROPERTY[@name='health-numeric']").text
+    return json.dumps({"data": lld}, separators=(',', ':')), health
+
+
+def old_volumes(xml):
+    """
+    'lld volumes' and 'full volumes' like zbx-hpmsa did it before XML backends.
+    """
+
+    lld, full = [], {}
+    for volume in xml.findall("./OBJECT[@name='volume']"):
+        volume_id = volume.find("./PROPERTY[@name='volume-name']").text
+        volume_type = volume.find("./PROPERTY[@name='volume-type']").text
+        lld.append({"{#VOLUME.ID}": "{}".format(volume_id), "{#VOLUME.TYPE}": "{}".format(volume_type)})
+    for volume in xml.findall("./OBJECT[@name='volume']"):
+        full[volume.find("./PROPERTY[@name='volume-name']").text] = {
+            "health": volume.find("./PROPERTY[@name='health']").text,
+            "health-num": volume.find("./PROPERTY[@name='health-numeric']").text,
+            "owner": volume.find("./PROPERTY[@name='owner']").text,
+            "owner-num": volume.find("./PROPERTY[@name='owner-numeric']").text,
+            "owner-pref": volume.find("./PROPERTY[@name='preferred-owner']").text,
+            "owner-pref-num": volume.find("./PROPERTY[@name='preferred-owner-numeric']").text
+        }
+    return json.dumps({"data": lld}, separators=(',', ':')), json.dumps(full, separators=(',', ':'))
+
+
+def new_disks(xml):
+    """
+    'lld disks' and health of all disks with zbx-hpmsa XML backend.
+    """
+
+    return zbx.make_lld(MSA, 'disks', None, xml), zbx.make_health_dict('disks', xml)
+
+
+def new_volumes(xml):
+    """
+    'lld volumes' and 'full volumes' with zbx-hpmsa XML backend.
+    """
+
+    # Only fields which were before bulk statistics, so statistics request isn't made
+    wanted = zbx.make_projection('volumes', ('health', 'health-num', 'owner', 'owner-num', 'owner-pref', 'owner-pref-num'))
+    return zbx.make_lld(MSA, 'volumes', None, xml), zbx.get_full_json(MSA, 'volumes', None, xml, wanted=wanted)
+
+
+def best_of(func, number):
+    """
+    Best time of 'number' runs in milliseconds.
+    """
+
+    return min(repeat(func, number=1, repeat=number)) * 1000
+
+
+def measure(name, parse, extract, content, number):
+    """
+    Print parse, extraction and total time of one case and return its output.
+    """
+
+    xml = parse(content)
+    parse_ms = best_of(lambda: parse(content), number)
+    extract_ms = best_of(lambda: extract(xml), number)
+    print('{:<24} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name, parse_ms, extract_ms, parse_ms + extract_ms))
+    return extract(xml)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark of zbx-hpmsa XML backends.')
+    parser.add_argument('--disks', type=int, default=480, help='Number of disks in synthetic response')
+    parser.add_argument('--volumes', type=int, default=1024, help='Number of volumes in synthetic response')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs, the best one is shown')
+    args = parser.parse_args()
+
+    # No requests are made, cache db is created in temporary directory, ring buffers aren't fed
+    TMP_DIR = TemporaryDirectory(prefix='zbx-hpmsa-bench-')
+    MSA = zbx.MSAClient('127.0.0.1', tmp_dir=TMP_DIR.name)
+    zbx.RING_METRICS = {}
+
+    disks_xml = make_doc('drive', 'drives', DISK_PROPS, args.disks, lambda i: {
+        'location': '{}.{}'.format(i // 24 + 1, i % 24 + 1), 'serial-number': 'SN{:08}'.format(i),
+        'health-numeric': str(i % 3), 'temperature-numeric': str(30 + i % 10), 'power-on-hours': str(i * 7)})
+    volumes_xml = make_doc('volume', 'volumes', VOLUME_PROPS, args.volumes, lambda i: {
+        'volume-name': 'vol{:04}'.format(i), 'owner': 'AB'[i % 2], 'health-numeric': str(i % 3)})
+
+    backends = ['etree'] + (['lxml'] if zbx.lxml_etree is not None else [])
+    for doc_name, content, old, new in (('show disks ({})'.format(args.disks), disks_xml, old_disks, new_disks),
+                                        ('show volumes ({})'.format(args.volumes), volumes_xml, old_volumes, new_volumes)):
+        print('{}, {:.1f} KiB'.format(doc_name, len(content) / 1024))
+        print('{:<24} {:>10} {:>10} {:>10}'.format('case', 'parse, ms', 'extract', 'total'))
+        expected = measure('old: etree + find()', eTree.fromstring, old, content, args.repeat)
+        for backend in backends:
+            zbx.XML_BACKEND = backend
+            if measure('new: ' + backend, zbx.parse_xml, new, content, args.repeat) != expected:
+                raise SystemExit('ERROR: Output of "{}" backend differs from the old one!'.format(backend))
+        print()
+    if 'lxml' not in backends:
+        print('lxml is not installed, only standard library backend was measured.')
+    else:
+        print('Output of all cases is identical.')
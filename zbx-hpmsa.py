@@ -2,17 +2,173 @@
 
 import os
 import grp
+import sys
 import json
+import mmap
+import fcntl
+import atexit
+import pstats
+import struct
+import cProfile
 import urllib3
+import tracemalloc
+from io import StringIO
+from math import ceil
+from bisect import bisect
+from array import array
+from time import time, sleep
 from hashlib import md5
-from socket import gethostbyname
-from argparse import ArgumentParser
+from socket import gethostbyname, gethostname
+from tempfile import mkstemp
+from argparse import ArgumentParser, ArgumentTypeError
 from xml.etree import ElementTree as eTree
 from datetime import datetime, timedelta
 
 import sqlite3
 import requests
 
+try:
+    from lxml import etree as lxml_etree
+
+    # Precompiled XPath expressions, attribute value is passed as variable
+    LXML_OBJECTS_XPATH = lxml_etree.XPath('OBJECT[@name = $name]')
+    LXML_TYPED_OBJECTS_XPATH = lxml_etree.XPath('OBJECT[@basetype = $basetype]')
+    LXML_PARSER = lxml_etree.XMLParser(resolve_entities=False, no_network=True)
+except ImportError:
+    lxml_etree = None
+
+# Current program version
+VERSION = '0.6.5'
+MSA_PARTS = ('disks', 'vdisks', 'controllers', 'enclosures', 'fans',
+             'power-supplies', 'ports', 'pools', 'disk-groups', 'volumes')
+
+# ?DELETE in v0.7 and correct make_lld()
+# Matches between CLI 'show' command args and OBJECT 'name' attribute in XML output.
+NAMES_MATCH = {
+    'disks': 'drive',
+    'vdisks': 'virtual-disk',
+    'controllers': 'controllers',
+    'enclosures': 'enclosures',
+    'power-supplies': 'power-supplies',
+    'fans': 'fan-details',
+    'ports': 'ports',
+    'pools': 'pools',
+    'disk-groups': 'disk-group',
+    'volumes': 'volume'
+}
+
+# Fields of full data as {field: property name}, tuples hold properties which are used as field names as is.
+HEALTH_FIELDS = {'health': 'health', 'health-num': 'health-numeric'}
+STATUS_FIELDS = {'status': 'status', 'status-num': 'status-numeric'}
+OWNER_FIELDS = {'owner': 'owner', 'owner-num': 'owner-numeric',
+                'owner-pref': 'preferred-owner', 'owner-pref-num': 'preferred-owner-numeric'}
+IO_FIELDS = ('number-of-reads', 'number-of-writes', 'data-read-numeric', 'data-written-numeric')
+RSP_FIELDS = ('avg-rsp-time', 'avg-read-rsp-time', 'avg-write-rsp-time')
+FULL_FIELDS = {
+    'disks': {
+        'main': dict(HEALTH_FIELDS, error='error'),
+        'stats': IO_FIELDS + ('queue-depth',) + tuple(
+            '{}-{}'.format(name, path) for path in (1, 2)
+            for name in ('smart-count', 'io-timeout-count', 'no-response-count', 'spinup-retry-count',
+                         'number-of-media-errors', 'number-of-nonmedia-errors', 'number-of-block-reassigns',
+                         'number-of-bad-blocks')),
+        'stats-ext': ('iops',),
+        'ext': {'temperature': 'temperature-numeric', 'power-on-hours': 'power-on-hours', 'disk-group': 'disk-group'}
+    },
+    'vdisks': {
+        'main': dict(HEALTH_FIELDS, **STATUS_FIELDS, **OWNER_FIELDS)
+    },
+    'pools': {
+        'main': dict(HEALTH_FIELDS, **OWNER_FIELDS),
+        'stats': IO_FIELDS + RSP_FIELDS
+    },
+    'disk-groups': {
+        'main': dict(HEALTH_FIELDS, **STATUS_FIELDS, **OWNER_FIELDS),
+        'stats': IO_FIELDS + ('iops',) + RSP_FIELDS
+    },
+    'volumes': {
+        'main': dict(HEALTH_FIELDS, **OWNER_FIELDS),
+        # Capacity and statistics properties, some of them are absent in old firmwares
+        'ext': {'size': 'size-numeric', 'total-size': 'total-size-numeric', 'allocated-size': 'allocated-size-numeric'},
+        'stats': dict([('iops', 'iops'), ('bytes-per-second', 'bytes-per-second-numeric')] +
+                      [(name, name) for name in IO_FIELDS + RSP_FIELDS + ('allocated-pages',)])
+    },
+    'controllers': {
+        'main': dict(HEALTH_FIELDS, **STATUS_FIELDS, **{'redundancy': 'redundancy-status',
+                                                       'redundancy-num': 'redundancy-status-numeric'}),
+        'stats': ('cpu-load', 'iops') + IO_FIELDS + ('read-cache-hits', 'read-cache-misses',
+                                                    'write-cache-hits', 'write-cache-misses'),
+        'fw': ('sc-fw',),
+        'flash': {'flash-health': 'health', 'flash-health-num': 'health-numeric',
+                  'flash-status': 'status', 'flash-status-num': 'status-numeric'}
+    },
+    'enclosures': {
+        'main': dict(HEALTH_FIELDS, **STATUS_FIELDS),
+        'ext': {'power': 'enclosure-power'},
+        # Made of 'sensor-status' output, not of enclosure properties
+        'sensors': ('sensors', 'temperature-max')
+    },
+    'power-supplies': {
+        'main': dict(HEALTH_FIELDS, **STATUS_FIELDS, **{'power-12v': 'dc12v', 'power-5v': 'dc5v', 'power-33v': 'dc33v',
+                                                       'power-12i': 'dc12i', 'power-5i': 'dc5i'}),
+        'ext': {'temperature': 'dctemp'}
+    },
+    'fans': {
+        'main': dict(HEALTH_FIELDS, **STATUS_FIELDS, speed='speed')
+    },
+    'ports': {
+        'main': HEALTH_FIELDS,
+        'stats': IO_FIELDS + ('queue-depth',) + RSP_FIELDS,
+        'ext': {'port-status': 'status', 'port-status-num': 'status-numeric'},
+        'details': ('sfp-status',)
+    }
+}
+# Fields which make_summary() is made of, they are collected with summary whatever the projection is.
+SUMMARY_FIELDS = {
+    'controllers': ('read-cache-hits', 'read-cache-misses', 'write-cache-hits', 'write-cache-misses'),
+    'disks': ('health', 'queue-depth', 'iops', 'disk-group')
+}
+# Fields which are needed only for summary, so they are added to full data only with it.
+SUMMARY_ONLY_FIELDS = {
+    'disks': ('iops', 'disk-group')
+}
+
+# Statistics which are sampled to ring buffers.
+RING_METRICS = {
+    'controllers': ('iops', 'cpu-load'),
+    'pools': ('avg-rsp-time',),
+    'ports': ('avg-rsp-time',)
+}
+# Ring buffer file is a header (magic, capacity, head, count) followed by (timestamp, value) records.
+RING_MAGIC = b'ZBXR'
+RING_HEADER = struct.Struct('4sIII')
+RING_RECORD = struct.Struct('dd')
+RING_SIZE = 4096
+# Aggregates of ring buffer samples added to full data as '<metric>-<aggregate>'.
+WINDOW_AGGREGATES = ('min', 'max', 'avg', 'p95')
+# Points of every collector node on consistent hashing ring.
+CLUSTER_VNODES = 64
+
+# Snapshot file header starts with magic and format version.
+SNAPSHOT_MAGIC = 'ZBXS'
+SNAPSHOT_VERSION = 1
+
+# Hot-path functions shown in profile report.
+PROFILE_PHASES = {
+    'query_xmlapi': 'HTTP requests (query_xmlapi)',
+    'parse_xml': 'XML parsing (parse_xml)',
+    'get_props': 'Property index (get_props)',
+    'get_full_data': 'Full data extraction (get_full_data)',
+    'get_lld': 'LLD extraction (get_lld)',
+    'get_health': 'Health extraction (get_health)',
+    'dumps': 'JSON serialisation (json.dumps)'
+}
+PROFILE_TOP = 40
+PROFILE_FRAMES = 10
+
+# XML parser of the process, CLI sets it from arguments. Connection settings are kept by MSAClient.
+XML_BACKEND = 'etree'
+
 
 def install_script(tmp_dir, group):
     """
@@ -36,25 +192,57 @@ def install_script(tmp_dir, group):
         raise SystemExit('PERMISSION ERROR: You have no permissions to create "{}" directory.'.format(tmp_dir))
 
     # Init cache db
-    if not os.path.exists(CACHE_DB):
-        sql_cmd('CREATE TABLE IF NOT EXISTS skey_cache ('
-                'dns_name TEXT NOT NULL, '
-                'ip TEXT NOT NULL, '
-                'proto TEXT NOT NULL, '
-                'expired TEXT NOT NULL, '
-                'skey TEXT NOT NULL DEFAULT 0, '
-                'PRIMARY KEY (dns_name, ip, proto))'
-                )
-        os.chmod(CACHE_DB, 0o664)
+    cache_db = cache_db_path(tmp_dir)
+    new_db = not os.path.exists(cache_db)
+    init_cache_db(cache_db)
+    if new_db:
+        os.chmod(cache_db, 0o664)
 
     # Set owner to tmp dir
     try:
         os.chown(tmp_dir, 0, grp.getgrnam(group).gr_gid)
-        os.chown(CACHE_DB, 0, grp.getgrnam(group).gr_gid)
+        os.chown(cache_db, 0, grp.getgrnam(group).gr_gid)
     except KeyError:
         print('WARNING: Cannot find group "{}" to set access rights. Using "root" group.'.format(group))
         os.chown(tmp_dir, 0, 0)
-        os.chown(CACHE_DB, 0, grp.getgrnam(group).gr_gid)
+        os.chown(cache_db, 0, grp.getgrnam(group).gr_gid)
+
+
+def cache_db_path(tmp_dir):
+    """
+    Get path to cache db in temp directory.
+
+    :param tmp_dir: Path to temporary directory.
+    :type tmp_dir: str
+    :return: Path to cache db.
+    :rtype: str
+    """
+
+    return tmp_dir.rstrip('/') + '/zbx-hpmsa.cache.db'
+
+
+def init_cache_db(cache_db):
+    """
+    Create tables of cache db.
+
+    :param cache_db: Path to cache db.
+    :type cache_db: str
+    :return: None
+    :rtype: None
+    """
+
+    sql_cmd(cache_db, 'CREATE TABLE IF NOT EXISTS skey_cache ('
+            'dns_name TEXT NOT NULL, '
+            'ip TEXT NOT NULL, '
+            'proto TEXT NOT NULL, '
+            'expired TEXT NOT NULL, '
+            'skey TEXT NOT NULL DEFAULT 0, '
+            'PRIMARY KEY (dns_name, ip, proto))'
+            )
+    init_rate_limit(cache_db)
+    init_result_cache(cache_db)
+    init_circuit_breaker(cache_db)
+    init_event_cursor(cache_db)
 
 
 def make_cred_hash(cred, isfile=False):
@@ -84,26 +272,44 @@ def make_cred_hash(cred, isfile=False):
     return hashed
 
 
-def sql_cmd(query, fetch_all=False):
+def resolve_msa(msa):
+    """
+    Make MSA address tuple used by other functions.
+
+    :param msa: MSA address (DNS name or IP).
+    :type msa: str
+    :return: Tuple (IP, DNS name).
+    :rtype: tuple
+    """
+
+    is_ip = all(elem.isdigit() for elem in msa.split('.'))
+    return msa if is_ip else gethostbyname(msa), msa
+
+
+def sql_cmd(cache_db, query, fetch_all=False, params=()):
     """
     Check and execute SQL query.
 
+    :param cache_db: Path to cache db.
+    :type cache_db: str
     :param query: SQL query to execute.
     :type query: str
     :param fetch_all: Set it True to execute fetchall().
     :type fetch_all: bool
+    :param params: Values for query placeholders.
+    :type params: tuple
     :return: Tuple with SQL query result.
     :rtype: tuple
     """
 
     try:
-        conn = sqlite3.connect(CACHE_DB)
+        conn = sqlite3.connect(cache_db)
         cursor = conn.cursor()
         try:
             if not fetch_all:
-                data = cursor.execute(query).fetchone()
+                data = cursor.execute(query, params).fetchone()
             else:
-                data = cursor.execute(query).fetchall()
+                data = cursor.execute(query, params).fetchall()
         except sqlite3.OperationalError as e:
             if str(e).startswith('no such table'):
                 raise SystemExit("Cache is empty")
@@ -116,10 +322,12 @@ def sql_cmd(query, fetch_all=False):
         print("ERROR: {}".format(e))
 
 
-def display_cache():
+def display_cache(cache_db):
     """
     Diplay cache data and exit.
 
+    :param cache_db: Path to cache db.
+    :type cache_db: str
     :return: None
     :rtype: None
     """
@@ -127,7 +335,7 @@ def display_cache():
     print("{:^30} {:^15} {:^7} {:^19} {:^32}".format('hostname', 'ip', 'proto', 'expired', 'sessionkey'))
     print("{:-^30} {:-^15} {:-^7} {:-^19} {:-^32}".format('-', '-', '-', '-', '-'))
 
-    for cache in sql_cmd('SELECT * FROM skey_cache', fetch_all=True):
+    for cache in sql_cmd(cache_db, 'SELECT * FROM skey_cache', fetch_all=True):
         name, ip, proto, expired, sessionkey = cache
         print("{:30} {:15} {:^7} {:19} {:32}".format(
             name, ip, proto, datetime.fromtimestamp(float(expired)).strftime("%H:%M:%S %d.%m.%Y"), sessionkey))
@@ -137,8 +345,8 @@ def get_skey(msa, hashed_login, use_cache=True):
     """
     Get session key from HP MSA API and and print it.
 
-    :param msa: MSA IP address and DNS name.
-    :type msa: tuple
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
     :param hashed_login: Hashed with md5 login data.
     :type hashed_login: str
     :param use_cache: The function will try to save session key to disk.
@@ -150,12 +358,13 @@ def get_skey(msa, hashed_login, use_cache=True):
     # Trying to use cached session key
     if use_cache:
         cur_timestamp = datetime.timestamp(datetime.utcnow())
-        if not USE_SSL:  # http
-            cache_data = sql_cmd('SELECT expired,skey FROM skey_cache WHERE ip="{}" AND proto="http"'.format(msa[0]))
+        if not msa.use_ssl:  # http
+            cache_data = sql_cmd(msa.cache_db,
+                                 'SELECT expired,skey FROM skey_cache WHERE ip="{}" AND proto="http"'.format(msa.ip))
         else:  # https
-            cache_data = sql_cmd('SELECT expired,skey '
+            cache_data = sql_cmd(msa.cache_db, 'SELECT expired,skey '
                                  'FROM skey_cache '
-                                 'WHERE dns_name="{}" AND IP ="{}" AND proto="https"'.format(msa[1], msa[0])
+                                 'WHERE dns_name="{}" AND IP ="{}" AND proto="https"'.format(msa.dns, msa.ip)
                                  )
         if cache_data is not None:
             cache_expired, cached_skey = cache_data
@@ -167,40 +376,41 @@ def get_skey(msa, hashed_login, use_cache=True):
             return get_skey(msa, hashed_login, use_cache=False)
     else:
         # Forming URL and trying to make GET query
-        msa_conn = msa[1] if VERIFY_SSL else msa[0]
+        msa_conn = msa.host
         url = '{}/api/login/{}'.format(msa_conn, hashed_login)
-        ret_code, sessionkey, xml = query_xmlapi(url=url, sessionkey=None)
+        ret_code, sessionkey, xml = query_xmlapi(msa, url=url, sessionkey=None)
 
         # 1 - success, write sessionkey to DB and return it
         if ret_code == '1':
             expired = datetime.timestamp(datetime.utcnow() + timedelta(minutes=30))
-            if not USE_SSL:
-                cache_data = sql_cmd('SELECT ip FROM skey_cache WHERE ip = "{}" AND proto="http"'.format(msa[0]))
+            if not msa.use_ssl:
+                cache_data = sql_cmd(msa.cache_db,
+                                     'SELECT ip FROM skey_cache WHERE ip = "{}" AND proto="http"'.format(msa.ip))
                 if cache_data is None:
-                    sql_cmd('INSERT INTO skey_cache VALUES ('
-                            '"{dns}", "{ip}", "http", "{time}", "{skey}")'.format(dns=msa[1], ip=msa[0],
+                    sql_cmd(msa.cache_db, 'INSERT INTO skey_cache VALUES ('
+                            '"{dns}", "{ip}", "http", "{time}", "{skey}")'.format(dns=msa.dns, ip=msa.ip,
                                                                                   time=expired, skey=sessionkey)
                             )
                 else:
-                    sql_cmd('UPDATE skey_cache SET skey="{skey}", expired="{expired}" '
-                            'WHERE ip="{ip}" AND proto="http"'.format(skey=sessionkey, expired=expired, ip=msa[0])
+                    sql_cmd(msa.cache_db, 'UPDATE skey_cache SET skey="{skey}", expired="{expired}" '
+                            'WHERE ip="{ip}" AND proto="http"'.format(skey=sessionkey, expired=expired, ip=msa.ip)
                             )
             else:
-                cache_data = sql_cmd('SELECT dns_name, ip FROM skey_cache '
-                                     'WHERE dns_name="{}" AND ip="{}" AND proto="https"'.format(msa[1], msa[0]))
+                cache_data = sql_cmd(msa.cache_db, 'SELECT dns_name, ip FROM skey_cache '
+                                     'WHERE dns_name="{}" AND ip="{}" AND proto="https"'.format(msa.dns, msa.ip))
                 if cache_data is None:
-                    sql_cmd('INSERT INTO skey_cache VALUES ('
-                            '"{name}", "{ip}", "https", "{expired}", "{skey}")'.format(name=msa[1], ip=msa[0],
+                    sql_cmd(msa.cache_db, 'INSERT INTO skey_cache VALUES ('
+                            '"{name}", "{ip}", "https", "{expired}", "{skey}")'.format(name=msa.dns, ip=msa.ip,
                                                                                        expired=expired,
                                                                                        skey=sessionkey
                                                                                        )
                             )
                 else:
-                    sql_cmd('UPDATE skey_cache SET skey = "{skey}", expired = "{expired}" '
+                    sql_cmd(msa.cache_db, 'UPDATE skey_cache SET skey = "{skey}", expired = "{expired}" '
                             'WHERE dns_name="{name}" AND ip="{ip}" AND proto="https"'.format(skey=sessionkey,
                                                                                              expired=expired,
-                                                                                             name=msa[1],
-                                                                                             ip=msa[0]
+                                                                                             name=msa.dns,
+                                                                                             ip=msa.ip
                                                                                              )
                             )
             return sessionkey
@@ -209,66 +419,368 @@ def get_skey(msa, hashed_login, use_cache=True):
             return ret_code
 
 
-def query_xmlapi(url, sessionkey):
+def init_rate_limit(cache_db):
+    """
+    Create rate limiter table if it doesn't exist yet.
+
+    :param cache_db: Path to cache db.
+    :type cache_db: str
+    :return: None
+    :rtype: None
+    """
+
+    sql_cmd(cache_db, 'CREATE TABLE IF NOT EXISTS rate_limit ('
+            'storage TEXT NOT NULL PRIMARY KEY, '
+            'tokens REAL NOT NULL, '
+            'updated REAL NOT NULL)'
+            )
+
+
+def rate_limit(msa):
+    """
+    Take one token from storage's bucket, waiting in queue if bucket is empty.
+
+    Bucket state is kept in cache db, so all running copies of the script share the same limit for one storage.
+    Every caller reserves its token in one transaction, so waiting callers are served in order of arrival.
+    Bucket is filled with 'msa.rate' tokens per second and holds 'msa.burst' tokens at most.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :return: Time in seconds spent in queue.
+    :rtype: float
+    """
+
+    storage, rate, burst = msa.ip, msa.rate, msa.burst
+    init_rate_limit(msa.cache_db)
+    try:
+        conn = sqlite3.connect(msa.cache_db, timeout=30, isolation_level=None)
+        cursor = conn.cursor()
+        # Lock the db for writing, so nobody can take our token between SELECT and UPDATE
+        cursor.execute('BEGIN IMMEDIATE')
+        now = time()
+        bucket = cursor.execute('SELECT tokens, updated FROM rate_limit WHERE storage = ?', (storage,)).fetchone()
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        # Token is reserved even if the bucket is empty, the debt is paid off by waiting
+        tokens -= 1
+        cursor.execute('INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?)', (storage, tokens, now))
+        cursor.execute('COMMIT')
+        conn.close()
+    except sqlite3.OperationalError as e:
+        raise SystemExit('ERROR: Cannot get rate limiter state. {}'.format(e))
+
+    waited = -tokens / rate if tokens < 0 else 0.0
+    if waited:
+        sleep(waited)
+    return waited
+
+
+def init_circuit_breaker(cache_db):
+    """
+    Create circuit breaker table if it doesn't exist yet.
+
+    :param cache_db: Path to cache db.
+    :type cache_db: str
+    :return: None
+    :rtype: None
+    """
+
+    sql_cmd(cache_db, 'CREATE TABLE IF NOT EXISTS circuit_breaker ('
+            'storage TEXT NOT NULL PRIMARY KEY, '
+            'failures INTEGER NOT NULL, '
+            'opened REAL NOT NULL, '
+            'probe REAL NOT NULL)'
+            )
+
+
+def circuit_check(msa):
+    """
+    Check circuit breaker state of the storage and fail fast if the storage is known as unreachable.
+
+    Circuit opens after 'msa.cb_threshold' failed requests in a row. While it's open, all requests fail at once.
+    After 'msa.cb_cooldown' seconds one caller is allowed to make a probe request, the others still fail until
+    the probe result is known or the probe is timed out.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :return: Number of failed requests in a row.
+    :rtype: int
+    """
+
+    storage, threshold, cooldown = msa.ip, msa.cb_threshold, msa.cb_cooldown
+
+    # Healthy storage is the common case, so state is only read and the db isn't locked for writing
+    now = time()
+    try:
+        conn = sqlite3.connect(msa.cache_db, timeout=30, isolation_level=None)
+        cursor = conn.cursor()
+        try:
+            state = cursor.execute('SELECT failures, opened, probe FROM circuit_breaker WHERE storage = ?',
+                                   (storage,)).fetchone()
+        except sqlite3.OperationalError as e:
+            # Nothing has failed yet if the table isn't created by install
+            if not str(e).startswith('no such table'):
+                raise
+            state = None
+        if state is None or state[0] < threshold:
+            conn.close()
+            return state[0] if state is not None else 0
+
+        failures, opened, probe = state
+        if now < opened + cooldown:
+            conn.close()
+            raise SystemExit('ERROR: Storage {} is unreachable ({} failed requests), next try in {:.0f} sec.'.format(
+                storage, failures, opened + cooldown - now))
+
+        # Cooldown is over: claim the probe, conditional UPDATE lets only one caller do it
+        cursor.execute('UPDATE circuit_breaker SET probe = ? '
+                       'WHERE storage = ? AND failures >= ? AND opened + ? <= ? AND probe + ? <= ?',
+                       (now, storage, threshold, cooldown, now, cooldown, now))
+        claimed = cursor.rowcount == 1
+        conn.close()
+    except sqlite3.OperationalError as e:
+        raise SystemExit('ERROR: Cannot get circuit breaker state. {}'.format(e))
+
+    if not claimed:
+        raise SystemExit('ERROR: Storage {} is unreachable ({} failed requests), probe is in progress.'.format(
+            storage, failures))
+    return failures
+
+
+def circuit_report(msa, success):
+    """
+    Save result of request to circuit breaker state of the storage.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param success: Was the storage reachable.
+    :type success: bool
+    :return: None
+    :rtype: None
+    """
+
+    storage, threshold = msa.ip, msa.cb_threshold
+    if success:
+        sql_cmd(msa.cache_db, 'DELETE FROM circuit_breaker WHERE storage = ?', params=(storage,))
+    else:
+        # Failed probe opens the circuit for one more cooldown period
+        now = time()
+        init_circuit_breaker(msa.cache_db)
+        sql_cmd(msa.cache_db, 'INSERT OR IGNORE INTO circuit_breaker VALUES (?, 0, 0, 0)', params=(storage,))
+        sql_cmd(msa.cache_db, 'UPDATE circuit_breaker SET failures = failures + 1, '
+                'opened = CASE WHEN failures + 1 >= ? THEN ? ELSE opened END, probe = 0 WHERE storage = ?',
+                params=(threshold, now, storage))
+
+
+def parse_xml(content):
+    """
+    Parse XML document with selected XML backend.
+
+    :param content: XML document.
+    :type content: bytes
+    :return: Root element of the document.
+    :rtype: Element
+    """
+
+    if XML_BACKEND == 'lxml':
+        return lxml_etree.fromstring(content, LXML_PARSER)
+    return eTree.fromstring(content)
+
+
+def find_objects(xml, name=None, basetype=None):
+    """
+    Find child OBJECT elements by 'name' or 'basetype' attribute.
+
+    :param xml: Parent element.
+    :type xml: Element
+    :param name: Value of 'name' attribute.
+    :type name: Union[str, None]
+    :param basetype: Value of 'basetype' attribute, used when name isn't given.
+    :type basetype: Union[str, None]
+    :return: List of found elements.
+    :rtype: list
+    """
+
+    if XML_BACKEND == 'lxml':
+        if name is not None:
+            return LXML_OBJECTS_XPATH(xml, name=name)
+        return LXML_TYPED_OBJECTS_XPATH(xml, basetype=basetype)
+    attr, value = ('name', name) if name is not None else ('basetype', basetype)
+    return [obj for obj in xml if obj.tag == 'OBJECT' and obj.get(attr) == value]
+
+
+def find_object(xml, name=None, basetype=None):
+    """
+    Find first child OBJECT element by 'name' or 'basetype' attribute.
+
+    :param xml: Parent element.
+    :type xml: Element
+    :param name: Value of 'name' attribute.
+    :type name: Union[str, None]
+    :param basetype: Value of 'basetype' attribute, used when name isn't given.
+    :type basetype: Union[str, None]
+    :return: Found element or None.
+    :rtype: Union[Element, None]
+    """
+
+    found = find_objects(xml, name, basetype)
+    return found[0] if found else None
+
+
+def get_props(obj, names=None):
+    """
+    Get child PROPERTY elements of OBJECT by 'name' attribute.
+
+    Needed properties are taken with one pass over children which stops when all of them are found,
+    it's much cheaper than a separate search for every property or indexing all of them (~90 for a disk).
+
+    :param obj: OBJECT element.
+    :type obj: Element
+    :param names: Names of needed properties, all properties are taken if None.
+    :type names: Union[Iterable[str], None]
+    :return: Dict with found properties as {name: text}.
+    :rtype: dict
+    """
+
+    if names is None:
+        # Reversed to keep first property if some name is repeated, like find() does
+        return {prop.get('name'): prop.text for prop in reversed(obj) if prop.tag == 'PROPERTY'}
+
+    missing = set(names)
+    props = {}
+    for prop in obj:
+        name = prop.get('name')
+        if name in missing and prop.tag == 'PROPERTY':
+            props[name] = prop.text
+            missing.discard(name)
+            if not missing:
+                break
+    return props
+
+
+def prop_names(*fields):
+    """
+    Get names of properties used by field maps of pick_props().
+
+    :param fields: Fields as {field: property name} or sequences of property names.
+    :type fields: Union[dict, tuple]
+    :return: Set of property names.
+    :rtype: set
+    """
+
+    names = set()
+    for names_map in fields:
+        names.update(names_map.values() if isinstance(names_map, dict) else names_map)
+    return names
+
+
+def query_xmlapi(msa, url, sessionkey):
     """
     Making HTTP(s) request to HP MSA XML API.
 
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
     :param url: URL to make GET request.
     :type url: str
     :param sessionkey: Session key to authorize.
     :type sessionkey: Union[str, None]
-    :return: Tuple with return code, return description and etree object <xml.etree.ElementTree.Element>.
+    :return: Tuple with return code, return description and root element of XML response.
     :rtype: tuple
     """
 
     # Set file where we can find root CA
     ca_file = '/etc/pki/tls/certs/ca-bundle.crt'
 
+    # Fail fast if the storage is known as unreachable. Keyed by IP, URL may hold either IP or DNS name.
+    failures = circuit_check(msa) if msa.cb_threshold > 0 else 0
+
+    # Wait for our turn if requests to the storage are limited
+    if msa.rate > 0:
+        msa.rate_waited += rate_limit(msa)
+
     # Makes GET request to URL
     try:
         # Connection timeout in seconds (connection, read).
         timeout = (1, 3)
-        full_url = 'https://' + url if USE_SSL else 'http://' + url
-        headers = {'sessionKey': sessionkey} if API_VERSION == 2 else {
-            'Cookie': "wbiusername={}; wbisessionkey={}".format(MSA_USERNAME, sessionkey)}
-        if USE_SSL:
-            if VERIFY_SSL:
-                response = requests.get(full_url, headers=headers, verify=ca_file, timeout=timeout)
+        full_url = 'https://' + url if msa.use_ssl else 'http://' + url
+        headers = {'sessionKey': sessionkey} if msa.api == 2 else {
+            'Cookie': "wbiusername={}; wbisessionkey={}".format(msa.username, sessionkey)}
+        if msa.use_ssl:
+            if msa.verify_ssl:
+                response = msa.session.get(full_url, headers=headers, verify=ca_file, timeout=timeout)
             else:
                 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                response = requests.get(full_url, headers=headers, verify=False, timeout=timeout)
+                response = msa.session.get(full_url, headers=headers, verify=False, timeout=timeout)
         else:
-            response = requests.get(full_url, headers=headers, timeout=timeout)
+            response = msa.session.get(full_url, headers=headers, timeout=timeout)
     except requests.exceptions.SSLError:
         raise SystemExit('ERROR: Cannot verify storage SSL Certificate.')
-    except requests.exceptions.ConnectTimeout:
+    except (requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout):
+        if msa.cb_threshold > 0:
+            circuit_report(msa, False)
         raise SystemExit('ERROR: Timeout occurred!')
     except requests.exceptions.ConnectionError as e:
+        if msa.cb_threshold > 0:
+            circuit_report(msa, False)
         raise SystemExit("ERROR: Cannot connect to storage {}.".format(e))
 
+    # Storage is reachable again, close the circuit
+    if failures > 0:
+        circuit_report(msa, True)
+
     # Reading data from server XML response
     try:
-        if SAVE_XML is not None and 'login' not in url:
+        if msa.save_xml is not None and 'login' not in url:
             try:
-                with open(SAVE_XML, 'w') as xml_file:
+                with open(msa.save_xml, 'w') as xml_file:
                     xml_file.write(response.text)
             except PermissionError:
-                    raise SystemExit('ERROR: Cannot save XML file to "{}"'.format(args.savexml))
-        response_xml = eTree.fromstring(response.content)
-        return_code = response_xml.find("./OBJECT[@name='status']/PROPERTY[@name='return-code']").text
-        return_response = response_xml.find("./OBJECT[@name='status']/PROPERTY[@name='response']").text
+                    raise SystemExit('ERROR: Cannot save XML file to "{}"'.format(msa.save_xml))
+        response_xml = parse_xml(response.content)
+        status = get_props(find_object(response_xml, 'status'), ('return-code', 'response'))
+        return_code = status['return-code']
+        return_response = status['response']
 
         return return_code, return_response, response_xml
-    except (ValueError, AttributeError) as e:
+    except (ValueError, AttributeError, KeyError, TypeError, SyntaxError) as e:
         raise SystemExit("ERROR: Cannot parse XML. {}".format(e))
 
 
+def make_health_dict(component, xml):
+    """
+    Collect health statuses of all objects of one MSA part.
+
+    :param component: Storage component name.
+    :type component: str
+    :param xml: Response of 'show' command for the component.
+    :type xml: Element
+    :return: Dict with health statuses as {component_id: health}.
+    :rtype: dict
+    """
+
+    # Components ID matching dict.
+    id_md = {
+        'disks': 'location', 'vdisks': 'name', 'controllers': 'controller-id', 'enclosures': 'enclosure-id',
+        'power-supplies': 'durable-id', 'fans': 'durable-id', 'pools': 'name', 'disk-groups': 'name', 'ports': 'port',
+        'volumes': 'volume-name'
+    }
+
+    health_dict = {}
+    names = (id_md[component], 'health-numeric')
+    for OBJ in find_objects(xml, NAMES_MATCH[component]):
+        props = get_props(OBJ, names)
+        health_dict[props[id_md[component]]] = props['health-numeric']
+    return health_dict
+
+
 def get_health(msa, component, item, sessionkey):
     """
     Get health status of single MSA part.
 
-    :param msa: MSA DNS name and IP address.
-    :type msa: tuple
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
     :param sessionkey: Session key.
     :type sessionkey: str
     :param component: Storage component name.
@@ -279,33 +791,24 @@ def get_health(msa, component, item, sessionkey):
     :rtype: str
     """
 
-    # Components ID matching dict.
-    id_md = {
-        'controllers': 'controller-id', 'enclosures': 'enclosure-id', 'power-supplies': 'durable-id',
-        'fans': 'durable-id', 'pools': 'name', 'disk-groups': 'name', 'ports': 'port', 'volumes': 'volume-name'
-    }
-
     # Forming url
-    msa_conn = msa[1] if VERIFY_SSL else msa[0]
+    msa_conn = msa.host
     if component in ('vdisks', 'disks'):
         url = '{strg}/api/show/{comp}/{item}'.format(strg=msa_conn, comp=component, item=item)
     else:
         url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=component)
 
     # Make a query to API
-    ret_code, descr, xml = query_xmlapi(url, sessionkey)
+    ret_code, descr, xml = query_xmlapi(msa, url, sessionkey)
     if ret_code != '0':
         raise SystemExit('ERROR: {} : {}'.format(ret_code, descr))
 
     # Return health status (int)
     if component in ('vdisks', 'disks'):
-        health = xml.find("./OBJECT[@name='{}']/PROPERTY[@name='health-numeric']".format(NAMES_MATCH[component])).text
+        health = get_props(find_object(xml, NAMES_MATCH[component]), ('health-numeric',))['health-numeric']
     else:
         # We'll make dict {ctrl_id: health} because of we cannot call API for exact of some components
-        health_dict = {}
-        for OBJ in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            comp_id = OBJ.find("./PROPERTY[@name='{}']".format(id_md[component])).text
-            health_dict[comp_id] = OBJ.find("./PROPERTY[@name='health-numeric']").text
+        health_dict = make_health_dict(component, xml)
         # If given item presents in our dict - return status
         if item in health_dict:
             health = health_dict[item]
@@ -314,560 +817,1761 @@ def get_health(msa, component, item, sessionkey):
     return health
 
 
-def make_lld(msa, component, sessionkey):
+def make_lld(msa, component, sessionkey, xml=None):
     """
     Form LLD JSON for Zabbix server.
 
-    :param msa: MSA DNS name and IP address.
-    :type msa: tuple
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
     :param sessionkey: Session key.
     :type sessionkey: str
     :param component: Name of storage component.
     :type component: str
+    :param xml: Already received response of 'show' command for the component, if any.
+    :type xml: Union[Element, None]
     :return: JSON with discovery data.
     :rtype: str
     """
 
+    return json.dumps({"data": get_lld(msa, component, sessionkey, xml)}, separators=(',', ':'))
+
+
+def get_lld(msa, component, sessionkey, xml=None):
+    """
+    Make discovery data of storage component.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param component: Name of storage component.
+    :type component: str
+    :param xml: Already received response of 'show' command for the component, if any.
+    :type xml: Union[Element, None]
+    :return: List with discovery macros of every object.
+    :rtype: list
+    """
+
     # Forming URL
-    msa_conn = msa[1] if VERIFY_SSL else msa[0]
+    msa_conn = msa.host
     url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=component)
 
     # Making request to API
-    resp_return_code, resp_description, xml = query_xmlapi(url, sessionkey)
-    if resp_return_code != '0':
-        raise SystemExit('ERROR: {rc} : {rd}'.format(rc=resp_return_code, rd=resp_description))
+    if xml is None:
+        resp_return_code, resp_description, xml = query_xmlapi(msa, url, sessionkey)
+        if resp_return_code != '0':
+            raise SystemExit('ERROR: {rc} : {rd}'.format(rc=resp_return_code, rd=resp_description))
 
     # Eject XML from response
     all_components = []
     # Vdisks is deprecated in HPE MSA 1040/2040+ so it stay here for compatibilities
     if component == 'disks':
-        for disk in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            disk_id = disk.find("./PROPERTY[@name='location']").text
-            disk_sn = disk.find("./PROPERTY[@name='serial-number']").text
+        for disk in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(disk, ('location', 'serial-number'))
             lld_dict = {
-                "{#DISK.ID}": "{}".format(disk_id),
-                "{#DISK.SN}": "{}".format(disk_sn)
+                "{#DISK.ID}": "{}".format(props['location']),
+                "{#DISK.SN}": "{}".format(props['serial-number'])
             }
             all_components.append(lld_dict)
     elif component == 'vdisks':
-        for vdisk in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            vdisk_id = vdisk.find("./PROPERTY[@name='name']").text
-            vdisk_type = vdisk.find("./PROPERTY[@name='storage-type']").text
+        for vdisk in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(vdisk, ('name', 'storage-type'))
             lld_dict = {
-                "{#VDISK.ID}": "{}".format(vdisk_id),
-                "{#VDISK.TYPE}": "{}".format(vdisk_type)
+                "{#VDISK.ID}": "{}".format(props['name']),
+                "{#VDISK.TYPE}": "{}".format(props['storage-type'])
             }
             all_components.append(lld_dict)
     elif component == 'pools':
-        for pool in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            pool_id = pool.find("./PROPERTY[@name='name']").text
-            pool_type = pool.find("./PROPERTY[@name='storage-type']").text
+        for pool in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(pool, ('name', 'storage-type'))
             lld_dict = {
-                "{#POOL.ID}": "{}".format(pool_id),
-                "{#POOL.TYPE}": "{}".format(pool_type)
+                "{#POOL.ID}": "{}".format(props['name']),
+                "{#POOL.TYPE}": "{}".format(props['storage-type'])
             }
             all_components.append(lld_dict)
     elif component == 'disk-groups':
-        for pool in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            dg_id = pool.find("./PROPERTY[@name='name']").text
-            dg_type = pool.find("./PROPERTY[@name='storage-type']").text
+        for dg in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(dg, ('name', 'storage-type'))
             lld_dict = {
-                "{#DG.ID}": "{}".format(dg_id),
-                "{#DG.TYPE}": "{}".format(dg_type)
+                "{#DG.ID}": "{}".format(props['name']),
+                "{#DG.TYPE}": "{}".format(props['storage-type'])
             }
             all_components.append(lld_dict)
     elif component == 'volumes':
-        for pool in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            volume_id = pool.find("./PROPERTY[@name='volume-name']").text
-            volume_type = pool.find("./PROPERTY[@name='volume-type']").text
+        for volume in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(volume, ('volume-name', 'volume-type'))
             lld_dict = {
-                "{#VOLUME.ID}": "{}".format(volume_id),
-                "{#VOLUME.TYPE}": "{}".format(volume_type)
+                "{#VOLUME.ID}": "{}".format(props['volume-name']),
+                "{#VOLUME.TYPE}": "{}".format(props['volume-type'])
             }
             all_components.append(lld_dict)
     elif component == 'controllers':
-        for ctrl in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            ctrl_id = ctrl.find("./PROPERTY[@name='controller-id']").text
-            ctrl_sn = ctrl.find("./PROPERTY[@name='serial-number']").text
-            ctrl_ip = ctrl.find("./PROPERTY[@name='ip-address']").text
-            ctrl_wwn = ctrl.find("./PROPERTY[@name='node-wwn']").text
+        for ctrl in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(ctrl, ('controller-id', 'serial-number', 'ip-address', 'node-wwn'))
             lld_dict = {
-                "{#CONTROLLER.ID}": "{}".format(ctrl_id),
-                "{#CONTROLLER.SN}": "{}".format(ctrl_sn),
-                "{#CONTROLLER.IP}": "{}".format(ctrl_ip),
-                "{#CONTROLLER.WWN}": "{}".format(ctrl_wwn),
+                "{#CONTROLLER.ID}": "{}".format(props['controller-id']),
+                "{#CONTROLLER.SN}": "{}".format(props['serial-number']),
+                "{#CONTROLLER.IP}": "{}".format(props['ip-address']),
+                "{#CONTROLLER.WWN}": "{}".format(props['node-wwn']),
             }
             all_components.append(lld_dict)
     elif component == 'enclosures':
-        for encl in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            encl_id = encl.find("./PROPERTY[@name='enclosure-id']").text
-            encl_sn = encl.find("./PROPERTY[@name='midplane-serial-number']").text
+        for encl in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(encl, ('enclosure-id', 'midplane-serial-number'))
             lld_dict = {
-                "{#ENCLOSURE.ID}": "{}".format(encl_id),
-                "{#ENCLOSURE.SN}": "{}".format(encl_sn)
+                "{#ENCLOSURE.ID}": "{}".format(props['enclosure-id']),
+                "{#ENCLOSURE.SN}": "{}".format(props['midplane-serial-number'])
             }
             all_components.append(lld_dict)
     elif component == 'power-supplies':
-        for PS in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            ps_id = PS.find("./PROPERTY[@name='durable-id']").text
-            ps_loc = PS.find("./PROPERTY[@name='location']").text
-            ps_name = PS.find("./PROPERTY[@name='name']").text
+        for PS in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(PS, ('name', 'durable-id', 'location'))
             # Exclude voltage regulators from discovery
-            if ps_name.lower().find('voltage regulator') == -1:
+            if props['name'].lower().find('voltage regulator') == -1:
                 lld_dict = {
-                    "{#POWERSUPPLY.ID}": "{}".format(ps_id),
-                    "{#POWERSUPPLY.LOCATION}": "{}".format(ps_loc)
+                    "{#POWERSUPPLY.ID}": "{}".format(props['durable-id']),
+                    "{#POWERSUPPLY.LOCATION}": "{}".format(props['location'])
                 }
                 all_components.append(lld_dict)
     elif component == 'fans':
-        for FAN in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            fan_id = FAN.find("./PROPERTY[@name='durable-id']").text
-            fan_loc = FAN.find("./PROPERTY[@name='location']").text
+        for FAN in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(FAN, ('durable-id', 'location'))
             lld_dict = {
-                "{#FAN.ID}": "{}".format(fan_id),
-                "{#FAN.LOCATION}": "{}".format(fan_loc)
+                "{#FAN.ID}": "{}".format(props['durable-id']),
+                "{#FAN.LOCATION}": "{}".format(props['location'])
             }
             all_components.append(lld_dict)
     elif component == 'ports':
-        for PORT in xml.findall("./OBJECT[@name='{}']".format(NAMES_MATCH[component])):
-            port_id = PORT.find("./PROPERTY[@name='port']").text
-            port_type = PORT.find("./PROPERTY[@name='port-type']").text
-            port_speed = PORT.find("./PROPERTY[@name='actual-speed']").text
-            port_sfp = PORT.find("./OBJECT[@name='port-details']/PROPERTY[@name='sfp-present']").text
+        for PORT in find_objects(xml, NAMES_MATCH[component]):
+            props = get_props(PORT, ('port', 'port-type', 'actual-speed'))
+            details = get_props(find_object(PORT, 'port-details'), ('sfp-present',))
             lld_dict = {
-                "{#PORT.ID}": "{}".format(port_id),
-                "{#PORT.TYPE}": "{}".format(port_type),
-                "{#PORT.SPEED}": "{}".format(port_speed),
-                "{#PORT.SFP}": "{}".format(port_sfp)
+                "{#PORT.ID}": "{}".format(props['port']),
+                "{#PORT.TYPE}": "{}".format(props['port-type']),
+                "{#PORT.SPEED}": "{}".format(props['actual-speed']),
+                "{#PORT.SFP}": "{}".format(details['sfp-present'])
             }
             all_components.append(lld_dict)
 
-    # Dumps JSON and return it
-    return json.dumps({"data": all_components}, separators=(',', ':'))
+    return all_components
+
+
+def full_fields(component):
+    """
+    Get names of all fields which full data of component can have.
+
+    :param component: Name of storage component.
+    :type component: str
+    :return: Field names.
+    :rtype: set
+    """
+
+    names = set()
+    for names_map in FULL_FIELDS[component].values():
+        names.update(names_map)
+    names.update('{}-{}'.format(metric, aggregate) for metric in RING_METRICS.get(component, ())
+                 for aggregate in WINDOW_AGGREGATES)
+    return names
+
+
+def make_projection(component, fields=None, exclude=None, summary=False):
+    """
+    Make function which tells if field of full data is needed.
+
+    :param component: Name of storage component.
+    :type component: str
+    :param fields: Names of fields to keep, all fields are kept if empty.
+    :type fields: Union[list, None]
+    :param exclude: Names of fields to drop.
+    :type exclude: Union[list, None]
+    :param summary: Summary is asked, fields from SUMMARY_ONLY_FIELDS are dropped without it.
+    :type summary: bool
+    :return: Function which takes field name and returns True if field is needed, None if all fields are needed.
+    :rtype: Union[function, None]
+    """
+
+    fields = frozenset(fields or ())
+    exclude = frozenset(exclude or ())
+    unknown = (fields | exclude) - full_fields(component)
+    if unknown:
+        raise SystemExit("ERROR: Unknown {} field(s): {}.".format(component, ', '.join(sorted(unknown))))
+    if not summary:
+        summary_only = fields.intersection(SUMMARY_ONLY_FIELDS.get(component, ()))
+        if summary_only:
+            raise SystemExit("ERROR: {} field(s) {} are available only with summary.".format(
+                component, ', '.join(sorted(summary_only))))
+        exclude = exclude.union(SUMMARY_ONLY_FIELDS.get(component, ()))
+    if not fields and not exclude:
+        return None
+    return lambda field: (not fields or field in fields) and field not in exclude
+
+
+def needs_fields(names, wanted):
+    """
+    Check if any of fields is needed by projection.
+
+    :param names: Names of fields.
+    :type names: Iterable[str]
+    :param wanted: Projection made by make_projection().
+    :type wanted: Union[function, None]
+    :return: True if any field is needed.
+    :rtype: bool
+    """
+
+    return wanted is None or any(wanted(name) for name in names)
+
+
+def pick_props(props, names, wanted=None, optional=False):
+    """
+    Select properties for full data.
+
+    :param props: Object properties as {name: value}.
+    :type props: dict
+    :param names: Fields as {field: property name} or sequence of property names used as field names.
+    :type names: Union[dict, tuple]
+    :param wanted: Projection made by make_projection(), all fields are selected if None.
+    :type wanted: Union[function, None]
+    :param optional: Skip properties which are absent in object (otherwise KeyError is raised).
+    :type optional: bool
+    :return: Selected fields as {field: value}.
+    :rtype: dict
+    """
+
+    if not isinstance(names, dict):
+        names = dict(zip(names, names))
+    return {field: props[name] for field, name in names.items()
+            if (wanted is None or wanted(field)) and (not optional or name in props)}
+
+
+def filter_fields(components, wanted):
+    """
+    Apply projection to already made full data.
+
+    :param components: Full data as {component_id: {field: value}}.
+    :type components: dict
+    :param wanted: Projection made by make_projection().
+    :type wanted: Union[function, None]
+    :return: Full data with needed fields only.
+    :rtype: dict
+    """
+
+    if wanted is None:
+        return components
+    return {item: {field: value for field, value in data.items() if wanted(field)}
+            for item, data in components.items()}
+
+
+def get_stats(msa, url, sessionkey, stats_name, nested=None, names=None):
+    """
+    Get properties of statistics object of one storage component.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param url: URL to make GET request.
+    :type url: str
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param stats_name: Name of statistics OBJECT in XML output.
+    :type stats_name: str
+    :param nested: Name of OBJECT inside statistics object which holds needed properties, if any.
+    :type nested: Union[str, None]
+    :param names: Names of needed properties, all properties are taken if None.
+    :type names: Union[Iterable[str], None]
+    :return: Dict with statistics properties.
+    :rtype: dict
+    """
+
+    # Making request to API
+    stats_ret_code, stats_descr, stats_xml = query_xmlapi(msa, url, sessionkey)
+    if stats_ret_code != '0':
+        raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
+
+    stats = find_object(stats_xml, stats_name)
+    if nested is not None:
+        stats = find_object(stats, nested)
+    return get_props(stats, names)
+
+
+def get_bulk_stats(msa, url, sessionkey, key, stats_name=None, basetype=None):
+    """
+    Get properties of statistics objects of all storage components with one request.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param url: URL to make GET request.
+    :type url: str
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param key: Name of property to index objects by.
+    :type key: str
+    :param stats_name: Name of statistics OBJECT in XML output.
+    :type stats_name: Union[str, None]
+    :param basetype: Basetype of statistics OBJECT in XML output, used when stats_name isn't given.
+    :type basetype: Union[str, None]
+    :return: Dict with statistics properties as {key: [properties, ...]}.
+    :rtype: dict
+    """
+
+    # Making request to API
+    stats_ret_code, stats_descr, stats_xml = query_xmlapi(msa, url, sessionkey)
+    if stats_ret_code != '0':
+        raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
+
+    all_stats = {}
+    for STAT in find_objects(stats_xml, stats_name, basetype):
+        stats = get_props(STAT)
+        all_stats.setdefault(stats.get(key), []).append(stats)
+    return all_stats
+
+
+def to_number(value):
+    """
+    Convert metric value of full data to number.
+
+    :param value: Metric value.
+    :type value: Union[str, None]
+    :return: Number, None if value is missing or non-numeric.
+    :rtype: Union[float, None]
+    """
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
 
-def get_full_json(msa, component, sessionkey):
+def hit_ratio(hits, misses):
+    """
+    Cache hit ratio in percents formatted for output, None if there were no cache accesses.
+
+    :param hits: Number of cache hits.
+    :type hits: float
+    :param misses: Number of cache misses.
+    :type misses: float
+    :return: Hit ratio like '97.50'.
+    :rtype: Union[str, None]
+    """
+
+    total = hits + misses
+    return '{:.2f}'.format(hits * 100 / total) if total > 0 else None
+
+
+def make_summary(component, components):
+    """
+    Compute aggregates over all objects of component with one pass over their data.
+
+    controllers: read and write cache hit ratios (total and per controller).
+    disks: counts of disks by health, hottest disk by queue depth and IOPS of disk groups summed from their disks.
+
+    :param component: Name of storage component.
+    :type component: str
+    :param components: Component data as {component_id: {metric: value}}, it must have fields from SUMMARY_FIELDS.
+    :type components: dict
+    :return: Aggregates, empty for parts without them.
+    :rtype: dict
+    """
+
+    summary = {}
+    if component == 'controllers':
+        # Hits and misses of all controllers for each cache
+        totals = {'read': [0.0, 0.0], 'write': [0.0, 0.0]}
+        by_controller = {}
+        for ctrl_id, data in components.items():
+            ratios = {}
+            for cache, total in totals.items():
+                hits = to_number(data.get('{}-cache-hits'.format(cache)))
+                misses = to_number(data.get('{}-cache-misses'.format(cache)))
+                # Skip controllers without statistics
+                if hits is not None and misses is not None:
+                    total[0] += hits
+                    total[1] += misses
+                    ratios['{}-cache-hit-ratio'.format(cache)] = hit_ratio(hits, misses)
+            by_controller[ctrl_id] = ratios
+        for cache, (hits, misses) in totals.items():
+            summary['{}-cache-hit-ratio'.format(cache)] = hit_ratio(hits, misses)
+        summary['controllers'] = by_controller
+    elif component == 'disks':
+        health_count = {}
+        dg_iops = {}
+        hottest = max_queue_depth = None
+        for disk_id, data in components.items():
+            health = data.get('health')
+            if health is not None:
+                health_count[health] = health_count.get(health, 0) + 1
+            queue_depth = to_number(data.get('queue-depth'))
+            if queue_depth is not None and (max_queue_depth is None or queue_depth > max_queue_depth):
+                hottest, max_queue_depth = disk_id, queue_depth
+            dg_name = data.get('disk-group')
+            if dg_name and dg_name != 'N/A':
+                dg = dg_iops.setdefault(dg_name, {"iops": 0.0, "disks": 0})
+                dg['disks'] += 1
+                iops = to_number(data.get('iops'))
+                if iops is not None:
+                    dg['iops'] += iops
+        summary['health'] = health_count
+        if hottest is not None:
+            summary['hottest-disk'] = hottest
+            summary['max-queue-depth'] = '{:g}'.format(max_queue_depth)
+        for dg in dg_iops.values():
+            dg['iops'] = '{:g}'.format(dg['iops'])
+        summary['disk-groups'] = dg_iops
+    return summary
+
+
+def get_full_json(msa, component, sessionkey, xml=None, window=None, wanted=None, summary=False):
     """
     Form text in JSON with storage component data.
 
-    :param msa: MSA DNS name and IP address.
-    :type msa: tuple
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
     :param sessionkey: Session key.
     :type sessionkey: str
     :param component: Name of storage component.
     :type component: str
+    :param xml: Already received response of 'show' command for the component, if any.
+    :type xml: Union[Element, None]
+    :param window: Add aggregates of sampled statistics for last 'window' seconds.
+    :type window: Union[int, None]
+    :param wanted: Projection made by make_projection().
+    :type wanted: Union[function, None]
+    :param summary: Add aggregates computed by make_summary() as 'summary' key.
+    :type summary: bool
     :return: JSON with all found data.
     :rtype: str
     """
 
+    return json.dumps(get_full_data(msa, component, sessionkey, xml, window, wanted, summary), separators=(',', ':'))
+
+
+def get_full_data(msa, component, sessionkey, xml=None, window=None, wanted=None, summary=False):
+    """
+    Collect storage component data.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param component: Name of storage component.
+    :type component: str
+    :param xml: Already received response of 'show' command for the component, if any.
+    :type xml: Union[Element, None]
+    :param window: Add aggregates of sampled statistics for last 'window' seconds.
+    :type window: Union[int, None]
+    :param wanted: Projection made by make_projection(), statistics requests are skipped if no their fields needed.
+                   All fields, including SUMMARY_ONLY_FIELDS, are collected if None.
+    :type wanted: Union[function, None]
+    :param summary: Add aggregates computed by make_summary() as 'summary' key.
+    :type summary: bool
+    :return: Data of all found objects as {component_id: {field: value}}.
+    :rtype: dict
+    """
+
     # Forming URL
-    msa_conn = msa[1] if VERIFY_SSL else msa[0]
+    msa_conn = msa.host
     url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=component)
 
     # Making request to API
-    resp_return_code, resp_description, xml = query_xmlapi(url, sessionkey)
-    if resp_return_code != '0':
-        raise SystemExit('ERROR: {rc} : {rd}'.format(rc=resp_return_code, rd=resp_description))
+    if xml is None:
+        resp_return_code, resp_description, xml = query_xmlapi(msa, url, sessionkey)
+        if resp_return_code != '0':
+            raise SystemExit('ERROR: {rc} : {rd}'.format(rc=resp_return_code, rd=resp_description))
+
+    # Summary fields are collected whatever the projection is, output is projected after summary is made
+    output = wanted
+    if summary and wanted is not None and component in SUMMARY_FIELDS:
+        wanted = lambda field: output(field) or field in SUMMARY_FIELDS[component]
 
     # Processing XML
+    fields = FULL_FIELDS[component]
     all_components = {}
     if component == 'disks':
-        for PROP in xml.findall("./OBJECT[@name='drive']"):
+        disk_main, disk_ext = fields['main'], fields['ext']
+        disk_stats, disk_stats_ext = fields['stats'], fields['stats-ext']
+        with_stats = needs_fields(disk_stats + disk_stats_ext, wanted)
+        names = prop_names(disk_main, disk_ext, ('location',))
+
+        for PROP in find_objects(xml, 'drive'):
             # Processing main properties
-            disk_location = PROP.find("./PROPERTY[@name='location']").text
-            disk_health = PROP.find("./PROPERTY[@name='health']").text
-            disk_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            disk_error = PROP.find("./PROPERTY[@name='error']").text
+            props = get_props(PROP, names)
+            disk_location = props['location']
+            disk_full_data = pick_props(props, disk_main, wanted)
 
             # Get disk statistics
-            url = '{strg}/api/show/{comp}/{item}'.format(strg=msa_conn, comp='disk-statistics', item=disk_location)
-
-            # Making request to API
-            stats_ret_code, stats_descr, stats_xml = query_xmlapi(url, sessionkey)
-            if stats_ret_code != '0':
-                raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
-
-            # THINK: I don't know, is it good solution, but it's one more query to XML API
-            disk_number_of_reads = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-reads']").text
-            disk_number_of_writes = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-writes']").text
-            disk_data_read_numeric = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='data-read-numeric']").text
-            disk_data_written_numeric = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='data-written-numeric']").text
-            disk_queue_depth = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='queue-depth']").text
-            disk_smart_count_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='smart-count-1']").text
-            disk_io_timeout_count_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='io-timeout-count-1']").text
-            disk_no_response_count_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='no-response-count-1']").text
-            disk_spinup_retry_count_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='spinup-retry-count-1']").text
-            disk_number_of_media_errors_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-media-errors-1']").text
-            disk_number_of_nonmedia_errors_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-nonmedia-errors-1']").text
-            disk_number_of_block_reassigns_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-block-reassigns-1']").text
-            disk_number_of_bad_blocks_1 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-bad-blocks-1']").text
-            disk_smart_count_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='smart-count-2']").text
-            disk_io_timeout_count_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='io-timeout-count-2']").text
-            disk_no_response_count_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='no-response-count-2']").text
-            disk_spinup_retry_count_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='spinup-retry-count-2']").text
-            disk_number_of_media_errors_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-media-errors-2']").text
-            disk_number_of_nonmedia_errors_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-nonmedia-errors-2']").text
-            disk_number_of_block_reassigns_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-block-reassigns-2']").text
-            disk_number_of_bad_blocks_2 = stats_xml.find("./OBJECT[@name='disk-statistics']/PROPERTY[@name='number-of-bad-blocks-2']").text
-
-            disk_full_data = {
-                "health": disk_health,
-                "health-num": disk_health_num,
-                "error": disk_error,
-                "number-of-reads": disk_number_of_reads,
-                "number-of-writes": disk_number_of_writes,
-                "data-read-numeric": disk_data_read_numeric,
-                "data-written-numeric": disk_data_written_numeric,
-                "queue-depth": disk_queue_depth,
-                "smart-count-1": disk_smart_count_1,
-                "io-timeout-count-1": disk_io_timeout_count_1,
-                "no-response-count-1": disk_no_response_count_1,
-                "spinup-retry-count-1": disk_spinup_retry_count_1,
-                "number-of-media-errors-1": disk_number_of_media_errors_1,
-                "number-of-nonmedia-errors-1": disk_number_of_nonmedia_errors_1,
-                "number-of-block-reassigns-1": disk_number_of_block_reassigns_1,
-                "number-of-bad-blocks-1": disk_number_of_bad_blocks_1,
-                "smart-count-2": disk_smart_count_2,
-                "io-timeout-count-2": disk_io_timeout_count_2,
-                "no-response-count-2": disk_no_response_count_2,
-                "spinup-retry-count-2": disk_spinup_retry_count_2,
-                "number-of-media-errors-2": disk_number_of_media_errors_2,
-                "number-of-nonmedia-errors-2": disk_number_of_nonmedia_errors_2,
-                "number-of-block-reassigns-2": disk_number_of_block_reassigns_2,
-                "number-of-bad-blocks-2": disk_number_of_bad_blocks_2,
-            }
+            if with_stats:
+                url = '{strg}/api/show/{comp}/{item}'.format(strg=msa_conn, comp='disk-statistics', item=disk_location)
+                # THINK: I don't know, is it good solution, but it's one more query to XML API
+                stats = get_stats(msa, url, sessionkey, 'disk-statistics', names=disk_stats + disk_stats_ext)
+                disk_full_data.update(pick_props(stats, disk_stats, wanted))
+                disk_full_data.update(pick_props(stats, disk_stats_ext, wanted, optional=True))
 
             # Processing advanced properties
-            disk_ext = dict()
-            disk_ext['temperature'] = PROP.find("./PROPERTY[@name='temperature-numeric']")
-            disk_ext['power-on-hours'] = PROP.find("./PROPERTY[@name='power-on-hours']")
-            for prop, value in disk_ext.items():
-                if value is not None:
-                    disk_full_data[prop] = value.text
+            disk_full_data.update(pick_props(props, disk_ext, wanted, optional=True))
             all_components[disk_location] = disk_full_data
     elif component == 'vdisks':
-        for PROP in xml.findall("./OBJECT[@name='virtual-disk']"):
-            vdisk_name = PROP.find("./PROPERTY[@name='name']").text
-            vdisk_health = PROP.find("./PROPERTY[@name='health']").text
-            vdisk_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            vdisk_status = PROP.find("./PROPERTY[@name='status']").text
-            vdisk_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            vdisk_owner = PROP.find("./PROPERTY[@name='owner']").text
-            vdisk_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            vdisk_owner_pref = PROP.find("./PROPERTY[@name='preferred-owner']").text
-            vdisk_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
-            vdisk_full_data = {
-                "health": vdisk_health,
-                "health-num": vdisk_health_num,
-                "status": vdisk_status,
-                "status-num": vdisk_status_num,
-                "owner": vdisk_owner,
-                "owner-num": vdisk_owner_num,
-                "owner-pref": vdisk_owner_pref,
-                "owner-pref-num": vdisk_owner_pref_num
-            }
-            all_components[vdisk_name] = vdisk_full_data
+        vdisk_main = fields['main']
+        names = prop_names(vdisk_main, ('name',))
+        for PROP in find_objects(xml, 'virtual-disk'):
+            props = get_props(PROP, names)
+            all_components[props['name']] = pick_props(props, vdisk_main, wanted)
     elif component == 'pools':
-        for PROP in xml.findall("./OBJECT[@name='pools']"):
-            pool_name = PROP.find("./PROPERTY[@name='name']").text
-            pool_health = PROP.find("./PROPERTY[@name='health']").text
-            pool_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            pool_owner = PROP.find("./PROPERTY[@name='owner']").text
-            pool_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            pool_owner_pref = PROP.find("./PROPERTY[@name='preferred-owner']").text
-            pool_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
+        pool_main, pool_stats = fields['main'], fields['stats']
+        with_stats = needs_fields(pool_stats, wanted)
+        names = prop_names(pool_main, ('name',))
+
+        for PROP in find_objects(xml, 'pools'):
+            props = get_props(PROP, names)
+            pool_name = props['name']
+            pool_full_data = pick_props(props, pool_main, wanted)
 
             # Get pool statistics
-            url = '{strg}/api/show/{comp}/pools/{item}'.format(strg=msa_conn, comp='pool-statistics', item=pool_name)
-
-            # Making request to API
-            stats_ret_code, stats_descr, stats_xml = query_xmlapi(url, sessionkey)
-            if stats_ret_code != '0':
-                raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
-
-            # THINK: I don't know, is it good solution, but it's one more query to XML API
-            pool_number_of_reads = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='number-of-reads']").text
-            pool_number_of_writes = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='number-of-writes']").text
-            pool_data_read_numeric = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='data-read-numeric']").text
-            pool_data_written_numeric = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='data-written-numeric']").text
-            pool_avg_rsp_time = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='avg-rsp-time']").text
-            pool_avg_read_rsp_time = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='avg-read-rsp-time']").text
-            pool_avg_write_rsp_time = stats_xml.find("./OBJECT[@name='pool-statistics']/OBJECT[@name='resettable-statistics']/PROPERTY[@name='avg-write-rsp-time']").text
-
-            pool_full_data = {
-                "health": pool_health,
-                "health-num": pool_health_num,
-                "owner": pool_owner,
-                "owner-num": pool_owner_num,
-                "owner-pref": pool_owner_pref,
-                "owner-pref-num": pool_owner_pref_num,
-                "number-of-reads": pool_number_of_reads,
-                "number-of-writes": pool_number_of_writes,
-                "data-read-numeric": pool_data_read_numeric,
-                "data-written-numeric": pool_data_written_numeric,
-                "avg-rsp-time": pool_avg_rsp_time,
-                "avg-read-rsp-time": pool_avg_read_rsp_time,
-                "avg-write-rsp-time": pool_avg_write_rsp_time,
-            }
+            if with_stats:
+                url = '{strg}/api/show/{comp}/pools/{item}'.format(strg=msa_conn, comp='pool-statistics', item=pool_name)
+                # THINK: I don't know, is it good solution, but it's one more query to XML API
+                stats = get_stats(msa, url, sessionkey, 'pool-statistics', nested='resettable-statistics', names=pool_stats)
+                pool_full_data.update(pick_props(stats, pool_stats, wanted))
             all_components[pool_name] = pool_full_data
     elif component == 'disk-groups':
-        for PROP in xml.findall("./OBJECT[@name='disk-group']"):
-            dg_name = PROP.find("./PROPERTY[@name='name']").text
-            dg_health = PROP.find("./PROPERTY[@name='health']").text
-            dg_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            dg_status = PROP.find("./PROPERTY[@name='status']").text
-            dg_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            dg_owner = PROP.find("./PROPERTY[@name='owner']").text
-            dg_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            dg_owner_pref = PROP.find("./PROPERTY[@name='preferred-owner']").text
-            dg_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
+        dg_main, dg_stats = fields['main'], fields['stats']
+        with_stats = needs_fields(dg_stats, wanted)
+        names = prop_names(dg_main, ('name',))
+
+        for PROP in find_objects(xml, 'disk-group'):
+            props = get_props(PROP, names)
+            dg_name = props['name']
+            dg_full_data = pick_props(props, dg_main, wanted)
 
             # Get disk-group statistics
-            url = '{strg}/api/show/{comp}/disk-group/{item}'.format(strg=msa_conn, comp='disk-group-statistics', item=dg_name)
-
-            # Making request to API
-            stats_ret_code, stats_descr, stats_xml = query_xmlapi(url, sessionkey)
-            if stats_ret_code != '0':
-                raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
-
-            # THINK: I don't know, is it good solution, but it's one more query to XML API
-            dg_number_of_reads = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='number-of-reads']").text
-            dg_number_of_writes = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='number-of-writes']").text
-            dg_data_read_numeric = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='data-read-numeric']").text
-            dg_data_written_numeric = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='data-written-numeric']").text
-            dg_iops = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='iops']").text
-            dg_avg_rsp_time = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='avg-rsp-time']").text
-            dg_avg_read_rsp_time = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='avg-read-rsp-time']").text
-            dg_avg_write_rsp_time = stats_xml.find("./OBJECT[@name='disk-group-statistics']/PROPERTY[@name='avg-write-rsp-time']").text
-
-            dg_full_data = {
-                "health": dg_health,
-                "health-num": dg_health_num,
-                "status": dg_status,
-                "status-num": dg_status_num,
-                "owner": dg_owner,
-                "owner-num": dg_owner_num,
-                "owner-pref": dg_owner_pref,
-                "owner-pref-num": dg_owner_pref_num,
-                "number-of-reads": dg_number_of_reads,
-                "number-of-writes": dg_number_of_writes,
-                "data-read-numeric": dg_data_read_numeric,
-                "data-written-numeric": dg_data_written_numeric,
-                "iops": dg_iops,
-                "avg-rsp-time": dg_avg_rsp_time,
-                "avg-read-rsp-time": dg_avg_read_rsp_time,
-                "avg-write-rsp-time": dg_avg_write_rsp_time
-            }
+            if with_stats:
+                url = '{strg}/api/show/{comp}/disk-group/{item}'.format(strg=msa_conn, comp='disk-group-statistics',
+                                                                         item=dg_name)
+                # THINK: I don't know, is it good solution, but it's one more query to XML API
+                stats = get_stats(msa, url, sessionkey, 'disk-group-statistics', names=dg_stats)
+                dg_full_data.update(pick_props(stats, dg_stats, wanted))
             all_components[dg_name] = dg_full_data
     elif component == 'volumes':
-        for PROP in xml.findall("./OBJECT[@name='volume']"):
-            volume_name = PROP.find("./PROPERTY[@name='volume-name']").text
-            volume_health = PROP.find("./PROPERTY[@name='health']").text
-            volume_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            volume_owner = PROP.find("./PROPERTY[@name='owner']").text
-            volume_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            volume_owner_pref = PROP.find("./PROPERTY[@name='preferred-owner']").text
-            volume_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
-            volume_full_data = {
-                "health": volume_health,
-                "health-num": volume_health_num,
-                "owner": volume_owner,
-                "owner-num": volume_owner_num,
-                "owner-pref": volume_owner_pref,
-                "owner-pref-num": volume_owner_pref_num
-            }
+        volume_main, volume_ext, volume_stats = fields['main'], fields['ext'], fields['stats']
+
+        # Get statistics of all volumes with one request
+        volumes_stats = {}
+        if needs_fields(volume_stats, wanted):
+            url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp='volume-statistics')
+            volumes_stats = get_bulk_stats(msa, url, sessionkey, 'volume-name', 'volume-statistics')
+
+        names = prop_names(volume_main, volume_ext, ('volume-name',))
+        for PROP in find_objects(xml, 'volume'):
+            props = get_props(PROP, names)
+            volume_name = props['volume-name']
+            volume_full_data = pick_props(props, volume_main, wanted)
+            volume_full_data.update(pick_props(props, volume_ext, wanted, optional=True))
+
+            # Processing volume statistics
+            if volume_name in volumes_stats:
+                volume_full_data.update(pick_props(volumes_stats[volume_name][0], volume_stats, wanted, optional=True))
             all_components[volume_name] = volume_full_data
     elif component == 'controllers':
-        for PROP in xml.findall("./OBJECT[@name='controllers']"):
+        ctrl_main, ctrl_stats, ctrl_ext = fields['main'], fields['stats'], fields['flash']
+        with_stats = needs_fields(ctrl_stats, wanted)
+        names = prop_names(ctrl_main, ('controller-id', 'sc-fw'))
+
+        for PROP in find_objects(xml, 'controllers'):
             # Processing main controller properties
-            ctrl_id = PROP.find("./PROPERTY[@name='controller-id']").text
-            ctrl_sc_fw = PROP.find("./PROPERTY[@name='sc-fw']").text
-            ctrl_health = PROP.find("./PROPERTY[@name='health']").text
-            ctrl_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            ctrl_status = PROP.find("./PROPERTY[@name='status']").text
-            ctrl_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            ctrl_rd_status = PROP.find("./PROPERTY[@name='redundancy-status']").text
-            ctrl_rd_status_num = PROP.find("./PROPERTY[@name='redundancy-status-numeric']").text
+            props = get_props(PROP, names)
+            ctrl_id = props['controller-id']
+            ctrl_full_data = pick_props(props, ctrl_main, wanted)
 
             # Get controller statistics
-            url = '{strg}/api/show/{comp}/{ctrl}'.format(strg=msa_conn, comp='controller-statistics', ctrl=ctrl_id)
-
-            # Making request to API
-            stats_ret_code, stats_descr, stats_xml = query_xmlapi(url, sessionkey)
-            if stats_ret_code != '0':
-                raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
-
-            # THINK: I don't know, is it good solution, but it's one more query to XML API
-            ctrl_cpu_load = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='cpu-load']").text
-            ctrl_iops = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='iops']").text
-            ctrl_number_of_reads = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='number-of-reads']").text
-            ctrl_number_of_writes = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='number-of-writes']").text
-            ctrl_data_read_numeric = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='data-read-numeric']").text
-            ctrl_data_written_numeric = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='data-written-numeric']").text
-            ctrl_read_cache_hits = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='read-cache-hits']").text
-            ctrl_read_cache_misses = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='read-cache-misses']").text
-            ctrl_write_cache_hits = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='write-cache-hits']").text
-            ctrl_write_cache_misses = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='write-cache-misses']").text
-
-            # Making full controller dict
-            ctrl_full_data = {
-                "health": ctrl_health,
-                "health-num": ctrl_health_num,
-                "status": ctrl_status,
-                "status-num": ctrl_status_num,
-                "redundancy": ctrl_rd_status,
-                "redundancy-num": ctrl_rd_status_num,
-                "cpu-load": ctrl_cpu_load,
-                "iops": ctrl_iops,
-                "number-of-reads": ctrl_number_of_reads,
-                "number-of-writes": ctrl_number_of_writes,
-                "data-read-numeric": ctrl_data_read_numeric,
-                "data-written-numeric": ctrl_data_written_numeric,
-                "read-cache-hits": ctrl_read_cache_hits,
-                "read-cache-misses": ctrl_read_cache_misses,
-                "write-cache-hits": ctrl_write_cache_hits,
-                "write-cache-misses": ctrl_write_cache_misses,
-                "sc-fw": ctrl_sc_fw
-            }
+            if with_stats:
+                url = '{strg}/api/show/{comp}/{ctrl}'.format(strg=msa_conn, comp='controller-statistics', ctrl=ctrl_id)
+                # THINK: I don't know, is it good solution, but it's one more query to XML API
+                stats = get_stats(msa, url, sessionkey, 'controller-statistics', names=ctrl_stats)
+                ctrl_full_data.update(pick_props(stats, ctrl_stats, wanted))
+            ctrl_full_data.update(pick_props(props, fields['fw'], wanted))
 
             # Processing advanced controller properties
-            ctrl_ext = dict()
-            ctrl_ext['flash-health'] = PROP.find("./OBJECT[@basetype='compact-flash']/PROPERTY[@name='health']")
-            ctrl_ext['flash-health-num'] = PROP.find(
-                "./OBJECT[@basetype='compact-flash']/PROPERTY[@name='health-numeric']")
-            ctrl_ext['flash-status'] = PROP.find("./OBJECT[@basetype='compact-flash']/PROPERTY[@name='status']")
-            ctrl_ext['flash-status-num'] = PROP.find(
-                "./OBJECT[@basetype='compact-flash']/PROPERTY[@name='status-numeric']")
-            for prop, value in ctrl_ext.items():
-                if value is not None:
-                    ctrl_full_data[prop] = value.text
+            if needs_fields(ctrl_ext, wanted):
+                flash = find_object(PROP, basetype='compact-flash')
+                if flash is not None:
+                    flash_props = get_props(flash, ctrl_ext.values())
+                    ctrl_full_data.update(pick_props(flash_props, ctrl_ext, wanted, optional=True))
             all_components[ctrl_id] = ctrl_full_data
     elif component == 'enclosures':
-        for PROP in xml.findall("./OBJECT[@name='enclosures']"):
+        encl_main = fields['main']
+
+        # Get sensors of all enclosures with one request
+        sensors = {}
+        if needs_fields(fields['sensors'], wanted):
+            url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp='sensor-status')
+            sensors = get_bulk_stats(msa, url, sessionkey, 'enclosure-id', basetype='sensors')
+
+        names = prop_names(encl_main, fields['ext'], ('enclosure-id',))
+        for PROP in find_objects(xml, 'enclosures'):
             # Processing main enclosure properties
-            encl_id = PROP.find("./PROPERTY[@name='enclosure-id']").text
-            encl_health = PROP.find("./PROPERTY[@name='health']").text
-            encl_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            encl_status = PROP.find("./PROPERTY[@name='status']").text
-            encl_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            # Making full enclosure dict
-            encl_full_data = {
-                "health": encl_health,
-                "health-num": encl_health_num,
-                "status": encl_status,
-                "status-num": encl_status_num
-            }
+            props = get_props(PROP, names)
+            encl_id = props['enclosure-id']
+            encl_full_data = pick_props(props, encl_main, wanted)
+
+            # Processing advanced enclosure properties
+            encl_full_data.update(pick_props(props, fields['ext'], wanted, optional=True))
+
+            # Processing enclosure sensors
+            if encl_id in sensors:
+                encl_sensors = {}
+                temperatures = []
+                for sensor in sensors[encl_id]:
+                    encl_sensors[sensor['sensor-name']] = {
+                        "value": sensor.get('value'),
+                        "status": sensor.get('status'),
+                        "status-num": sensor.get('status-numeric')
+                    }
+                    # Temperature value looks like '34 C'
+                    if sensor.get('sensor-type') == 'Temperature' and sensor.get('value'):
+                        try:
+                            temperatures.append(float(sensor['value'].split()[0]))
+                        except ValueError:
+                            pass
+                if temperatures and (wanted is None or wanted('temperature-max')):
+                    encl_full_data['temperature-max'] = '{:g}'.format(max(temperatures))
+                if wanted is None or wanted('sensors'):
+                    encl_full_data['sensors'] = encl_sensors
             all_components[encl_id] = encl_full_data
     elif component == 'power-supplies':
+        ps_main = fields['main']
+        names = prop_names(ps_main, fields['ext'], ('name', 'durable-id'))
         # Getting info about all power supplies
-        for PS in xml.findall("./OBJECT[@name='power-supplies']"):
+        for PS in find_objects(xml, 'power-supplies'):
             # Processing main power supplies properties
-            ps_id = PS.find("./PROPERTY[@name='durable-id']").text
-            ps_name = PS.find("./PROPERTY[@name='name']").text
+            props = get_props(PS, names)
             # Exclude voltage regulators
-            if ps_name.lower().find('voltage regulator') == -1:
-                ps_health = PS.find("./PROPERTY[@name='health']").text
-                ps_health_num = PS.find("./PROPERTY[@name='health-numeric']").text
-                ps_status = PS.find("./PROPERTY[@name='status']").text
-                ps_status_num = PS.find("./PROPERTY[@name='status-numeric']").text
-                ps_dc12v = PS.find("./PROPERTY[@name='dc12v']").text
-                ps_dc5v = PS.find("./PROPERTY[@name='dc5v']").text
-                ps_dc33v = PS.find("./PROPERTY[@name='dc33v']").text
-                ps_dc12i = PS.find("./PROPERTY[@name='dc12i']").text
-                ps_dc5i = PS.find("./PROPERTY[@name='dc5i']").text
-                ps_full_data = {
-                    "health": ps_health,
-                    "health-num": ps_health_num,
-                    "status": ps_status,
-                    "status-num": ps_status_num,
-                    "power-12v": ps_dc12v,
-                    "power-5v": ps_dc5v,
-                    "power-33v": ps_dc33v,
-                    "power-12i": ps_dc12i,
-                    "power-5i": ps_dc5i
-                }
+            if props['name'].lower().find('voltage regulator') == -1:
+                ps_full_data = pick_props(props, ps_main, wanted)
                 # Processing advanced power supplies properties
-                ps_ext = dict()
-                ps_ext['temperature'] = PS.find("./PROPERTY[@name='dctemp']")
-                for prop, value in ps_ext.items():
-                    if value is not None:
-                        ps_full_data[prop] = value.text
-                all_components[ps_id] = ps_full_data
+                ps_full_data.update(pick_props(props, fields['ext'], wanted, optional=True))
+                all_components[props['durable-id']] = ps_full_data
     elif component == 'fans':
+        fan_main = fields['main']
+        names = prop_names(fan_main, ('durable-id',))
         # Getting info about all fans
-        for FAN in xml.findall("./OBJECT[@name='fan-details']"):
+        for FAN in find_objects(xml, 'fan-details'):
             # Processing main fan properties
-            fan_id = FAN.find(".PROPERTY[@name='durable-id']").text
-            fan_health = FAN.find(".PROPERTY[@name='health']").text
-            fan_health_num = FAN.find(".PROPERTY[@name='health-numeric']").text
-            fan_status = FAN.find(".PROPERTY[@name='status']").text
-            fan_status_num = FAN.find(".PROPERTY[@name='status-numeric']").text
-            fan_speed = FAN.find(".PROPERTY[@name='speed']").text
-            fan_full_data = {
-                "health": fan_health,
-                "health-num": fan_health_num,
-                "status": fan_status,
-                "status-num": fan_status_num,
-                "speed": fan_speed
-            }
-            all_components[fan_id] = fan_full_data
+            props = get_props(FAN, names)
+            all_components[props['durable-id']] = pick_props(props, fan_main, wanted)
     elif component == 'ports':
-        for FC in xml.findall("./OBJECT[@name='ports']"):
+        port_main, port_stats, port_ext = fields['main'], fields['stats'], fields['ext']
+        with_stats = needs_fields(port_stats, wanted)
+        names = prop_names(port_main, port_ext, ('port',))
+
+        for FC in find_objects(xml, 'ports'):
             # Processing main ports properties
-            port_name = FC.find("./PROPERTY[@name='port']").text
-            port_health = FC.find("./PROPERTY[@name='health']").text
-            port_health_num = FC.find("./PROPERTY[@name='health-numeric']").text
-
-            # Get host port statistics
-            url = '{strg}/api/show/{comp}/ports/{item}'.format(strg=msa_conn, comp='host-port-statistics', item=port_name)
-
-            # Making request to API
-            stats_ret_code, stats_descr, stats_xml = query_xmlapi(url, sessionkey)
-            if stats_ret_code != '0':
-                raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
-
-            # THINK: I don't know, is it good solution, but it's one more query to XML API
-            port_number_of_reads = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='number-of-reads']").text
-            port_number_of_writes = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='number-of-writes']").text
-            port_data_read_numeric = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='data-read-numeric']").text
-            port_data_written_numeric = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='data-written-numeric']").text
-            port_queue_depth = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='queue-depth']").text
-            port_avg_rsp_time = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='avg-rsp-time']").text
-            port_avg_read_rsp_time = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='avg-read-rsp-time']").text
-            port_avg_write_rsp_time = stats_xml.find("./OBJECT[@name='host-port-statistics']/PROPERTY[@name='avg-write-rsp-time']").text
-
-            if port_health_num != '4':
-                port_full_data = {
-                    "health": port_health,
-                    "health-num": port_health_num,
-                    "number-of-reads": port_number_of_reads,
-                    "number-of-writes": port_number_of_writes,
-                    "data-read-numeric": port_data_read_numeric,
-                    "data-written-numeric": port_data_written_numeric,
-                    "queue-depth": port_queue_depth,
-                    "avg-rsp-time": port_avg_rsp_time,
-                    "avg-read-rsp-time": port_avg_read_rsp_time,
-                    "avg-write-rsp-time": port_avg_write_rsp_time,
-                }
+            props = get_props(FC, names)
+            port_name = props['port']
+
+            if props['health-numeric'] != '4':
+                port_full_data = pick_props(props, port_main, wanted)
+
+                # Get host port statistics
+                if with_stats:
+                    url = '{strg}/api/show/{comp}/ports/{item}'.format(strg=msa_conn, comp='host-port-statistics',
+                                                                       item=port_name)
+                    # THINK: I don't know, is it good solution, but it's one more query to XML API
+                    stats = get_stats(msa, url, sessionkey, 'host-port-statistics', names=port_stats)
+                    port_full_data.update(pick_props(stats, port_stats, wanted))
 
                 # Processing advanced ports properties
-                port_ext = dict()
-                port_ext['port-status'] = FC.find("./PROPERTY[@name='status']")
-                port_ext['port-status-num'] = FC.find("./PROPERTY[@name='status-numeric']")
-                port_ext['sfp-status'] = FC.find("./OBJECT[@name='port-details']/PROPERTY[@name='sfp-status']")
-                for prop, value in port_ext.items():
-                    if value is not None:
-                        port_full_data[prop] = value.text
+                port_full_data.update(pick_props(props, port_ext, wanted, optional=True))
+                if needs_fields(fields['details'], wanted):
+                    details = find_object(FC, 'port-details')
+                    if details is not None:
+                        port_full_data.update(pick_props(get_props(details, fields['details']), fields['details'], wanted,
+                                                         optional=True))
                 all_components[port_name] = port_full_data
-    return json.dumps(all_components, separators=(',', ':'))
 
+    # Keep sampled statistics in ring buffers
+    if component in RING_METRICS:
+        feed_rings(msa, component, all_components)
+        if window is not None:
+            add_window_stats(msa, component, all_components, window, wanted)
+    if summary:
+        components_summary = make_summary(component, all_components)
+        if wanted is not output:
+            all_components = filter_fields(all_components, output)
+        all_components['summary'] = components_summary
+    return all_components
 
-if __name__ == '__main__':
-    # Current program version
-    VERSION = '0.6.5'
-    MSA_PARTS = ('disks', 'vdisks', 'controllers', 'enclosures', 'fans',
-                 'power-supplies', 'ports', 'pools', 'disk-groups', 'volumes')
 
+def parse_window(window):
+    """
+    Convert time window like '90', '60s', '5m' or '1h' to seconds.
+
+    :param window: Time window.
+    :type window: str
+    :return: Window length in seconds.
+    :rtype: int
+    """
+
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    try:
+        if window[-1] in units:
+            seconds = int(window[:-1]) * units[window[-1]]
+        else:
+            seconds = int(window)
+    except (ValueError, IndexError):
+        raise ArgumentTypeError("invalid time window: '{}'".format(window))
+    if seconds <= 0:
+        raise ArgumentTypeError("time window must be positive: '{}'".format(window))
+    return seconds
+
+
+def ring_path(msa, part, item, metric):
+    """
+    Make path to the ring buffer file of one metric.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param part: Name of storage component.
+    :type part: str
+    :param item: Component ID.
+    :type item: str
+    :param metric: Metric name.
+    :type metric: str
+    :return: Path to ring buffer file.
+    :rtype: str
+    """
+
+    file_name = '{}_{}_{}_{}.ring'.format(msa.ip, part, item, metric).replace('/', '-')
+    return os.path.join(msa.tmp_dir, 'ring', file_name)
+
+
+def ring_append(path, timestamp, value):
+    """
+    Write one sample to the ring buffer file, overwriting the oldest one if buffer is full.
+
+    File is created with RING_SIZE slots on first write and never grows after that.
+
+    :param path: Path to ring buffer file.
+    :type path: str
+    :param timestamp: Sample time.
+    :type timestamp: float
+    :param value: Sample value.
+    :type value: float
+    :return: None
+    :rtype: None
+    """
+
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o775, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o664)
+    except PermissionError:
+        raise SystemExit('ERROR: Cannot write ring buffer file "{}"'.format(path))
+    try:
+        # Lock is released when file is closed
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if os.fstat(fd).st_size == 0:
+            os.ftruncate(fd, RING_HEADER.size + RING_SIZE * RING_RECORD.size)
+            os.write(fd, RING_HEADER.pack(RING_MAGIC, RING_SIZE, 0, 0))
+        with mmap.mmap(fd, 0) as ring:
+            magic, capacity, head, count = RING_HEADER.unpack_from(ring)
+            if magic != RING_MAGIC:
+                raise SystemExit('ERROR: File "{}" is not a ring buffer.'.format(path))
+            RING_RECORD.pack_into(ring, RING_HEADER.size + head * RING_RECORD.size, timestamp, value)
+            RING_HEADER.pack_into(ring, 0, magic, capacity, (head + 1) % capacity, min(count + 1, capacity))
+    finally:
+        os.close(fd)
+
+
+def ring_window(path, window):
+    """
+    Read samples from the ring buffer file which are not older than given window.
+
+    :param path: Path to ring buffer file.
+    :type path: str
+    :param window: Window length in seconds.
+    :type window: int
+    :return: Sample values.
+    :rtype: array.array
+    """
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return array('d')
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # Writer creates the file before it takes the lock and sizes it, so it can still be empty here
+        if os.fstat(fd).st_size < RING_HEADER.size:
+            return array('d')
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as ring:
+            magic, capacity, head, count = RING_HEADER.unpack_from(ring)
+            if magic != RING_MAGIC:
+                raise SystemExit('ERROR: File "{}" is not a ring buffer.'.format(path))
+            # Records are (timestamp, value) pairs, so timestamps are on even positions and values on odd ones
+            records = array('d', ring[RING_HEADER.size:RING_HEADER.size + count * RING_RECORD.size])
+    finally:
+        os.close(fd)
+
+    since = time() - window
+    return array('d', (value for stamp, value in zip(records[0::2], records[1::2]) if stamp >= since))
+
+
+def window_stats(values):
+    """
+    Calculate min, max, average and 95th percentile of samples.
+
+    :param values: Sample values.
+    :type values: array.array
+    :return: Dict with aggregates.
+    :rtype: dict
+    """
+
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    p95 = ordered[max(ceil(len(ordered) * 0.95) - 1, 0)]
+    return {
+        'min': ordered[0],
+        'max': ordered[-1],
+        'avg': sum(ordered) / len(ordered),
+        'p95': p95
+    }
+
+
+def feed_rings(msa, component, components):
+    """
+    Save current values of component metrics to ring buffers.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param component: Name of storage component.
+    :type component: str
+    :param components: Component data as {component_id: {metric: value}}.
+    :type components: dict
+    :return: None
+    :rtype: None
+    """
+
+    now = time()
+    for item, data in components.items():
+        for metric in RING_METRICS[component]:
+            try:
+                value = float(data[metric])
+            except (KeyError, TypeError, ValueError):
+                continue
+            ring_append(ring_path(msa, component, item, metric), now, value)
+
+
+def add_window_stats(msa, component, components, window, wanted=None):
+    """
+    Add aggregates of ring buffer samples to component data as '<metric>-min', '<metric>-max' etc.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param component: Name of storage component.
+    :type component: str
+    :param components: Component data as {component_id: {metric: value}}.
+    :type components: dict
+    :param window: Window length in seconds.
+    :type window: int
+    :param wanted: Projection made by make_projection().
+    :type wanted: Union[function, None]
+    :return: None
+    :rtype: None
+    """
+
+    for item, data in components.items():
+        for metric in RING_METRICS[component]:
+            keys = {name: '{}-{}'.format(metric, name) for name in WINDOW_AGGREGATES}
+            if not needs_fields(keys.values(), wanted):
+                continue
+            values = ring_window(ring_path(msa, component, item, metric), window)
+            if values:
+                for name, value in window_stats(values).items():
+                    if wanted is None or wanted(keys[name]):
+                        data[keys[name]] = '{:.2f}'.format(value)
+
+
+def sample_statistics(msa, parts, sessionkey):
+    """
+    Get statistics of all objects of each part with one request and save them to ring buffers.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param parts: Names of storage components.
+    :type parts: list
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :return: None
+    :rtype: None
+    """
+
+    # Matches between part and its statistics object name
+    stats_md = {'controllers': 'controller-statistics', 'pools': 'pool-statistics', 'ports': 'host-port-statistics'}
+
+    msa_conn = msa.host
+    for part in parts:
+        url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=stats_md[part])
+
+        # Making request to API
+        stats_ret_code, stats_descr, stats_xml = query_xmlapi(msa, url, sessionkey)
+        if stats_ret_code != '0':
+            raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
+
+        samples = {}
+        for STAT in find_objects(stats_xml, stats_md[part]):
+            props = get_props(STAT)
+            if part == 'pools':
+                item = props['pool']
+                props = get_props(find_object(STAT, 'resettable-statistics'))
+            else:
+                # 'controller_A' -> 'A', 'hostport_A1' -> 'A1'
+                item = props['durable-id'].split('_')[-1]
+            samples[item] = props
+        feed_rings(msa, part, samples)
+
+
+def init_event_cursor(cache_db):
+    """
+    Create event cursor table if it doesn't exist yet.
+
+    :param cache_db: Path to cache db.
+    :type cache_db: str
+    :return: None
+    :rtype: None
+    """
+
+    sql_cmd(cache_db, 'CREATE TABLE IF NOT EXISTS event_cursor ('
+            'storage TEXT NOT NULL PRIMARY KEY, '
+            'stamp INTEGER NOT NULL, '
+            'ids TEXT NOT NULL)'
+            )
+
+
+def get_events(msa, sessionkey, last):
+    """
+    Get events which were logged after the previous call and move the cursor to the newest of them.
+
+    Cursor (time stamp and IDs of last seen events) is kept in cache db for each storage. The first call returns
+    'last' newest events, next ones request only events since the cursor time stamp.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param last: Number of events to return if there is no cursor for the storage yet.
+    :type last: int
+    :return: JSON with new events.
+    :rtype: str
+    """
+
+    init_event_cursor(msa.cache_db)
+    cursor = sql_cmd(msa.cache_db, 'SELECT stamp, ids FROM event_cursor WHERE storage = ?', params=(msa.ip,))
+
+    # Forming URL, 'from' is inclusive and uses storage time in MMDDYYhhmmss format
+    msa_conn = msa.host
+    if cursor is None:
+        url = '{strg}/api/show/events/last/{last}'.format(strg=msa_conn, last=last)
+        last_stamp, last_ids = 0, set()
+    else:
+        last_stamp, last_ids = cursor[0], set(cursor[1].split(','))
+        url = '{strg}/api/show/events/from/{ts}'.format(
+            strg=msa_conn, ts=datetime.utcfromtimestamp(last_stamp).strftime('%m%d%y%H%M%S'))
+
+    # Making request to API
+    ret_code, descr, xml = query_xmlapi(msa, url, sessionkey)
+    if ret_code != '0':
+        raise SystemExit('ERROR: {} : {}'.format(ret_code, descr))
+
+    new_events = []
+    # Storage returns newest events first
+    for EVENT in reversed(find_objects(xml, basetype='events')):
+        props = get_props(EVENT)
+        event_stamp = int(props['time-stamp-numeric'])
+        # Skip events which were returned by previous call
+        if event_stamp < last_stamp or (event_stamp == last_stamp and props['event-id'] in last_ids):
+            continue
+        new_events.append({
+            "event-id": props['event-id'],
+            "event-code": props.get('event-code'),
+            "time-stamp": props.get('time-stamp'),
+            "time-stamp-num": props['time-stamp-numeric'],
+            "severity": props.get('severity'),
+            "severity-num": props.get('severity-numeric'),
+            "controller": props.get('controller'),
+            "message": props.get('message'),
+            "additional-information": props.get('additional-information'),
+            "recommended-action": props.get('recommended-action')
+        })
+    new_events.sort(key=lambda event: int(event['time-stamp-num']))
+
+    # Move cursor to the newest event, remember all IDs with its time stamp
+    if new_events:
+        newest_stamp = int(new_events[-1]['time-stamp-num'])
+        newest_ids = set(event['event-id'] for event in new_events if int(event['time-stamp-num']) == newest_stamp)
+        if newest_stamp == last_stamp:
+            newest_ids |= last_ids
+        sql_cmd(msa.cache_db, 'INSERT OR REPLACE INTO event_cursor VALUES (?, ?, ?)',
+                params=(msa.ip, newest_stamp, ','.join(sorted(newest_ids))))
+    return json.dumps({"data": new_events}, separators=(',', ':'))
+
+
+def init_result_cache(cache_db):
+    """
+    Create result cache table if it doesn't exist yet.
+
+    :param cache_db: Path to cache db.
+    :type cache_db: str
+    :return: None
+    :rtype: None
+    """
+
+    sql_cmd(cache_db, 'CREATE TABLE IF NOT EXISTS result_cache ('
+            'storage TEXT NOT NULL, '
+            'command TEXT NOT NULL, '
+            'part TEXT NOT NULL, '
+            'updated REAL NOT NULL, '
+            'data TEXT NOT NULL, '
+            'PRIMARY KEY (storage, command, part))'
+            )
+
+
+def store_result(msa, command, part, data):
+    """
+    Save command result to the result cache.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param command: Name of command which made the result ('lld', 'full' or 'health').
+    :type command: str
+    :param part: Name of storage component.
+    :type part: str
+    :param data: Command result.
+    :type data: str
+    :return: None
+    :rtype: None
+    """
+
+    init_result_cache(msa.cache_db)
+    sql_cmd(msa.cache_db, 'INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?)',
+            params=(msa.ip, command, part, time(), data))
+
+
+def get_result(msa, command, part, max_age):
+    """
+    Get command result from the result cache.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param command: Name of command which made the result ('lld', 'full' or 'health').
+    :type command: str
+    :param part: Name of storage component.
+    :type part: str
+    :param max_age: Max age of the result in seconds.
+    :type max_age: int
+    :return: Cached result or None if it's absent or outdated.
+    :rtype: Union[str, None]
+    """
+
+    init_result_cache(msa.cache_db)
+    cache_data = sql_cmd(msa.cache_db,
+                         'SELECT updated, data FROM result_cache WHERE storage = ? AND command = ? AND part = ?',
+                         params=(msa.ip, command, part))
+    if cache_data is not None and time() - cache_data[0] <= max_age:
+        return cache_data[1]
+    return None
+
+
+def collect_part(msa, part, commands, sessionkey):
+    """
+    Collect data of one MSA part for several commands with one 'show' request.
+
+    'lld' and 'health' results are made from the same response, so they are always refreshed together.
+    'full' result needs additional statistics requests, so it's collected only when asked.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param part: Name of storage component.
+    :type part: str
+    :param commands: Commands which are needed ('lld', 'full', 'health').
+    :type commands: Union[set, list]
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :return: Dict with command results as {command: result}.
+    :rtype: dict
+    """
+
+    # Forming URL
+    msa_conn = msa.host
+    url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=part)
+
+    # Making request to API
+    ret_code, descr, xml = query_xmlapi(msa, url, sessionkey)
+    if ret_code != '0':
+        raise SystemExit('ERROR: {} : {}'.format(ret_code, descr))
+
+    results = {
+        'lld': make_lld(msa, part, sessionkey, xml),
+        'health': json.dumps(make_health_dict(part, xml), separators=(',', ':'))
+    }
+    if 'full' in commands:
+        results['full'] = get_full_json(msa, part, sessionkey, xml)
+    return results
+
+
+def cluster_nodes(cluster_file, node_id, ttl, heartbeat=True):
+    """
+    Update heartbeat of the node in membership file shared by collector nodes and get alive nodes.
+
+    File has one 'node_id timestamp' line per node, nodes without heartbeat for 'ttl' seconds are removed from it.
+
+    :param cluster_file: Path to membership file.
+    :type cluster_file: str
+    :param node_id: Id of this node.
+    :type node_id: str
+    :param ttl: Seconds after last heartbeat when node is considered dead.
+    :type ttl: float
+    :param heartbeat: Update heartbeat of the node, otherwise the file is only read (for callers which don't poll).
+    :type heartbeat: bool
+    :return: Sorted ids of alive nodes.
+    :rtype: list
+    """
+
+    now = time()
+    try:
+        with open(cluster_file, 'a+') as members:
+            fcntl.flock(members, fcntl.LOCK_EX if heartbeat else fcntl.LOCK_SH)
+            members.seek(0)
+            heartbeats = {}
+            for line in members:
+                try:
+                    member, beat = line.split()
+                    heartbeats[member] = float(beat)
+                except ValueError:
+                    continue
+            if heartbeat:
+                heartbeats[node_id] = now
+            alive = {member: beat for member, beat in heartbeats.items() if now - beat <= ttl}
+            if heartbeat:
+                members.seek(0)
+                members.truncate()
+                members.write(''.join('{} {:.3f}\n'.format(member, beat) for member, beat in sorted(alive.items())))
+    except OSError as e:
+        raise SystemExit('ERROR: Cannot use cluster membership file "{}": {}'.format(cluster_file, e))
+    return sorted(alive)
+
+
+def mark_node(tmp_dir, node_id):
+    """
+    Leave mark of polling node in 'nodes' subdirectory of temp directory for check_shared_dir().
+
+    :param tmp_dir: Path to temp directory with result cache and snapshots.
+    :type tmp_dir: str
+    :param node_id: Id of this node.
+    :type node_id: str
+    :return: None
+    :rtype: None
+    """
+
+    try:
+        os.makedirs(os.path.join(tmp_dir, 'nodes'), exist_ok=True)
+        open(os.path.join(tmp_dir, 'nodes', node_id), 'a').close()
+    except OSError as e:
+        raise SystemExit('ERROR: Cannot mark node in temp directory "{}": {}'.format(tmp_dir, e))
+
+
+def check_shared_dir(tmp_dir, nodes):
+    """
+    Check that temp directory is shared by collector nodes, so results of MSA polled by one node are seen by others.
+
+    :param tmp_dir: Path to temp directory with result cache and snapshots.
+    :type tmp_dir: str
+    :param nodes: Ids of alive nodes, marks of all of them must be seen in the directory.
+    :type nodes: list
+    :return: None
+    :rtype: None
+    """
+
+    unseen = [node for node in nodes if not os.path.exists(os.path.join(tmp_dir, 'nodes', node))]
+    if unseen:
+        raise SystemExit('ERROR: Temp directory "{}" is not shared with collector node(s) {}, their results '
+                         'cannot be read. Use the same --tmp-dir on shared storage on all nodes.'.format(
+                             tmp_dir, ', '.join(unseen)))
+
+
+def cluster_owner(key, nodes):
+    """
+    Find node which owns the key with consistent hashing, so only keys of gone node move to other ones.
+
+    :param key: Key to find owner for (MSA address).
+    :type key: str
+    :param nodes: Ids of alive nodes.
+    :type nodes: list
+    :return: Id of owner node.
+    :rtype: str
+    """
+
+    def position(name):
+        return int(md5(name.encode()).hexdigest()[:16], 16)
+
+    ring = sorted((position('{}#{}'.format(node, i)), node) for node in nodes for i in range(CLUSTER_VNODES))
+    index = bisect(ring, (position(key), ''))
+    return ring[index % len(ring)][1]
+
+
+def is_cluster_owner(msa, cluster, heartbeat=True):
+    """
+    Check if this node should poll the MSA, updating node heartbeat.
+
+    Nodes share results through temp directory, so it's checked to be shared by all alive nodes.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param cluster: Membership file, node id and heartbeat TTL, None if node works alone.
+    :type cluster: Union[tuple, None]
+    :param heartbeat: Update heartbeat of the node, False for callers which only read results.
+    :type heartbeat: bool
+    :return: True if node owns the MSA or no node is alive to poll it.
+    :rtype: bool
+    """
+
+    if cluster is None:
+        return True
+    cluster_file, node_id, ttl = cluster
+    # Node joins only if it sees the others in temp directory, and its mark is left before heartbeat,
+    # so misconfigured node doesn't take MSAs and the others never see the node without its mark
+    nodes = cluster_nodes(cluster_file, node_id, ttl, heartbeat=False)
+    check_shared_dir(msa.tmp_dir, [node for node in nodes if node != node_id])
+    if heartbeat:
+        mark_node(msa.tmp_dir, node_id)
+        nodes = cluster_nodes(cluster_file, node_id, ttl)
+    return not nodes or cluster_owner(msa.ip, nodes) == node_id
+
+
+def run_scheduler(msa, hashed_login, parts, intervals, spacing, once=False, cluster=None):
+    """
+    Poll MSA parts with own interval for each command and save results to the result cache.
+
+    Commands of one part which are due together are made with one 'show' request.
+    Parts are polled one by one with pause between them, so the storage never gets all requests at once.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param hashed_login: Hashed with md5 login data.
+    :type hashed_login: str
+    :param parts: Names of storage components to poll.
+    :type parts: list
+    :param intervals: Poll intervals in seconds as {command: interval}, zero interval disables command.
+    :type intervals: dict
+    :param spacing: Pause between requests for different parts in seconds.
+    :type spacing: float
+    :param once: Poll due parts one time and exit.
+    :type once: bool
+    :param cluster: Membership file, node id and heartbeat TTL, MSA is polled only while this node owns it.
+    :type cluster: Union[tuple, None]
+    :return: None
+    :rtype: None
+    """
+
+    # Don't retry failed part until the shortest interval passes
+    retry_at = {}
+    min_interval = min(interval for interval in intervals.values() if interval > 0)
+    # Heartbeat must be updated more often than TTL
+    max_sleep = cluster[2] / 3 if cluster is not None else min_interval
+    while True:
+        # Membership file or temp directory may be unavailable for a while, node doesn't poll meanwhile
+        try:
+            owner = is_cluster_owner(msa, cluster)
+        except SystemExit as e:
+            if once:
+                raise
+            print('{} (cluster)'.format(e), file=sys.stderr)
+            owner = False
+        if not owner:
+            if once:
+                break
+            sleep(max_sleep)
+            continue
+
+        now = time()
+        init_result_cache(msa.cache_db)
+        updated = {(command, part): upd for command, part, upd in sql_cmd(
+            msa.cache_db, 'SELECT command, part, updated FROM result_cache WHERE storage = ?', fetch_all=True,
+            params=(msa.ip,))}
+
+        # Find out what is due
+        due = {}
+        next_run = now + min_interval
+        for part in parts:
+            for command, interval in intervals.items():
+                if interval <= 0:
+                    continue
+                run_at = max(updated.get((command, part), 0) + interval, retry_at.get(part, 0))
+                if run_at <= now:
+                    due.setdefault(part, set()).add(command)
+                else:
+                    next_run = min(next_run, run_at)
+
+        if due:
+            # Storage may be unreachable (or its circuit open) at login, try again on the next tick
+            try:
+                sessionkey = get_skey(msa, hashed_login)
+            except SystemExit as e:
+                sessionkey = None
+                for part in due:
+                    retry_at[part] = time() + min_interval
+                print('{} (login)'.format(e), file=sys.stderr)
+            for i, (part, commands) in enumerate(due.items() if sessionkey is not None else ()):
+                if i:
+                    sleep(spacing)
+                    # Long poll must not miss heartbeat, MSA may be taken by other node meanwhile
+                    try:
+                        if not is_cluster_owner(msa, cluster):
+                            break
+                    except SystemExit:
+                        break
+                try:
+                    for command, result in collect_part(msa, part, commands, sessionkey).items():
+                        # lld and health are collected together, but disabled one isn't stored
+                        if intervals.get(command, 0) > 0:
+                            store_result(msa, command, part, result)
+                except SystemExit as e:
+                    retry_at[part] = time() + min_interval
+                    print('{} ({})'.format(e, part), file=sys.stderr)
+
+        if once:
+            break
+        sleep(min(max(next_run - time(), 1), max_sleep))
+
+
+def snapshot_path(msa, command, part):
+    """
+    Make path to the snapshot file of one command result.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param command: Name of command which made the result ('lld', 'full' or 'health').
+    :type command: str
+    :param part: Name of storage component.
+    :type part: str
+    :return: Path to snapshot file.
+    :rtype: str
+    """
+
+    return os.path.join(msa.tmp_dir, 'snapshots', '{}_{}_{}.snap'.format(msa.ip, command, part))
+
+
+def write_snapshot(msa, command, part, data):
+    """
+    Atomically replace snapshot file of command result.
+
+    File starts with header line '<magic> <format version> <created> <generation>', followed by the result.
+    New version is written to temporary file and renamed over the old one, so readers see either old or new
+    snapshot, but never half-written one.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param command: Name of command which made the result ('lld', 'full' or 'health').
+    :type command: str
+    :param part: Name of storage component.
+    :type part: str
+    :param data: Command result.
+    :type data: str
+    :return: None
+    :rtype: None
+    """
+
+    path = snapshot_path(msa, command, part)
+    previous = read_snapshot_header(path)
+    generation = previous[2] + 1 if previous is not None else 1
+    header = '{} {} {:.6f} {}\n'.format(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, time(), generation)
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o775, exist_ok=True)
+        fd, tmp_path = mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'w') as snapshot:
+            snapshot.write(header)
+            snapshot.write(data)
+        os.chmod(tmp_path, 0o664)
+        os.replace(tmp_path, path)
+    except PermissionError:
+        raise SystemExit('ERROR: Cannot write snapshot file "{}"'.format(path))
+
+
+def read_snapshot_header(path):
+    """
+    Read header of snapshot file.
+
+    :param path: Path to snapshot file.
+    :type path: str
+    :return: Tuple with format version, creation time and generation or None if file is absent or broken.
+    :rtype: Union[tuple, None]
+    """
+
+    try:
+        with open(path, 'rb') as snapshot:
+            header = snapshot.readline().split()
+        if len(header) != 4 or header[0].decode() != SNAPSHOT_MAGIC:
+            return None
+        return int(header[1]), float(header[2]), int(header[3])
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def read_snapshot(msa, command, part, max_age):
+    """
+    Read command result from snapshot file through mmap.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param command: Name of command which made the result ('lld', 'full' or 'health').
+    :type command: str
+    :param part: Name of storage component.
+    :type part: str
+    :param max_age: Max age of snapshot in seconds.
+    :type max_age: int
+    :return: Command result.
+    :rtype: str
+    """
+
+    path = snapshot_path(msa, command, part)
+    try:
+        with open(path, 'rb') as snapshot, mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as snap_map:
+            header_end = snap_map.find(b'\n')
+            header = snap_map[:header_end].split()
+            if len(header) != 4 or header[0].decode() != SNAPSHOT_MAGIC or int(header[1]) != SNAPSHOT_VERSION:
+                raise SystemExit('ERROR: Snapshot "{}" has unknown format.'.format(path))
+            age = time() - float(header[2])
+            if age > max_age:
+                raise SystemExit('ERROR: Snapshot "{}" is too old ({:.0f} sec).'.format(path, age))
+            return snap_map[header_end + 1:].decode()
+    except (FileNotFoundError, ValueError):
+        raise SystemExit('ERROR: There is no snapshot "{}". Is prefetch running?'.format(path))
+
+
+def run_prefetch(msa, sessionkey, parts, commands):
+    """
+    Collect command results for MSA parts and save them as snapshots.
+
+    :param msa: MSA client with connection settings.
+    :type msa: MSAClient
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param parts: Names of storage components.
+    :type parts: list
+    :param commands: Commands to make snapshots for ('lld', 'full', 'health').
+    :type commands: list
+    :return: None
+    :rtype: None
+    """
+
+    failed = []
+    for part in parts:
+        try:
+            results = collect_part(msa, part, commands, sessionkey)
+        except SystemExit as e:
+            print('{} ({})'.format(e, part), file=sys.stderr)
+            failed.append(part)
+            continue
+        for command in commands:
+            write_snapshot(msa, command, part, results[command])
+    if failed:
+        raise SystemExit('ERROR: Cannot prefetch parts: {}.'.format(', '.join(failed)))
+
+
+class MSAClient(object):
+    """
+    HPE MSA XML API client to use the script as library in long-running tools.
+
+    Client keeps connection settings, HTTP session and parsed responses of 'show' command (for 'cache_ttl' seconds),
+    so lld(), full() and health() of the same part make one request. Session key is taken from cache db.
+    Client is passed as 'msa' to module functions, they take connection settings from it, so clients of different
+    MSAs don't share any state except cache db and can be used from different threads at the same time.
+    Errors are raised as SystemExit with message, like in CLI.
+
+    The script name isn't valid module name, so load it with importlib:
+
+        spec = importlib.util.spec_from_file_location('zbx_hpmsa', '/path/to/zbx-hpmsa.py')
+        zbx_hpmsa = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(zbx_hpmsa)
+        with zbx_hpmsa.MSAClient('10.0.0.1') as msa:
+            disks = msa.lld('disks')
+            controllers = msa.full('controllers')
+    """
+
+    def __init__(self, msa, username='monitor', password='!monitor', login_file=None, api=2, ssl=None,
+                 save_xml=None, rate=0, burst=5, cb_threshold=3, cb_cooldown=60, tmp_dir='/dev/shm/zbx-hpmsa/',
+                 cache_ttl=30):
+        """
+        :param msa: MSA address (DNS name or IP).
+        :type msa: str
+        :param username: User name to login in MSA.
+        :type username: str
+        :param password: Password of the user.
+        :type password: str
+        :param login_file: Path to file contains login and password, used instead of username and password.
+        :type login_file: Union[str, None]
+        :param api: MSA API version (1 or 2).
+        :type api: int
+        :param ssl: Use HTTPS: 'direct' or 'verify' (check certificate, connect by DNS name), HTTP if None.
+        :type ssl: Union[str, None]
+        :param save_xml: Path to save last response from storage.
+        :type save_xml: Union[str, None]
+        :param rate: Max requests per second to the MSA, 0 - no limit.
+        :type rate: float
+        :param burst: Number of requests allowed without waiting when rate is set.
+        :type burst: int
+        :param cb_threshold: Failed requests in a row after which MSA is not queried for a while, 0 - off.
+        :type cb_threshold: int
+        :param cb_cooldown: Seconds to fail at once after MSA became unreachable.
+        :type cb_cooldown: float
+        :param tmp_dir: Path to temp directory with cache db, created if it doesn't exist.
+        :type tmp_dir: str
+        :param cache_ttl: Seconds to keep parsed responses, 0 - don't keep.
+        :type cache_ttl: float
+        """
+
+        self.ip, self.dns = resolve_msa(msa)
+        self.api = api
+        self.use_ssl = ssl in ('direct', 'verify')
+        self.verify_ssl = ssl == 'verify'
+        self.save_xml = save_xml
+        self.username = username
+        if login_file is not None:
+            self.cred_hash = make_cred_hash(login_file, isfile=True)
+        else:
+            self.cred_hash = make_cred_hash('_'.join([username, password]))
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # Seconds spent in rate limiter queue by this client
+        self.rate_waited = 0.0
+        self.cb_threshold = cb_threshold
+        self.cb_cooldown = cb_cooldown
+        self.tmp_dir = tmp_dir
+        self.cache_db = cache_db_path(tmp_dir)
+        # Keeps connections alive between requests
+        self.session = requests.Session()
+        self.cache_ttl = cache_ttl
+        self.responses = {}
+
+        # Prepare cache db if the script wasn't installed
+        if not os.path.exists(self.cache_db):
+            try:
+                os.makedirs(tmp_dir, exist_ok=True)
+            except PermissionError:
+                raise SystemExit('PERMISSION ERROR: You have no permissions to create "{}" directory.'.format(tmp_dir))
+            init_cache_db(self.cache_db)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def host(self):
+        """
+        MSA address used in URLs: DNS name if certificate is verified, IP otherwise.
+        """
+
+        return self.dns if self.verify_ssl else self.ip
+
+    def close(self):
+        """
+        Close HTTP connections and drop kept responses.
+        """
+
+        self.session.close()
+        self.responses.clear()
+
+    def sessionkey(self):
+        """
+        Get session key, MSA is asked for new one only when cached key is expired.
+
+        :return: Session key.
+        :rtype: str
+        """
+
+        sessionkey = get_skey(self, self.cred_hash)
+        if sessionkey is None or sessionkey == '2':
+            raise SystemExit('ERROR: Cannot login to MSA {}.'.format(self.dns))
+        return sessionkey
+
+    def show(self, part):
+        """
+        Get parsed response of 'show' command for MSA part.
+
+        :param part: Name of storage component.
+        :type part: str
+        :return: Root element of XML response.
+        :rtype: Element
+        """
+
+        if part in self.responses and time() - self.responses[part][0] < self.cache_ttl:
+            return self.responses[part][1]
+        url = '{strg}/api/show/{comp}'.format(strg=self.host, comp=part)
+        ret_code, descr, xml = query_xmlapi(self, url, self.sessionkey())
+        if ret_code != '0':
+            raise SystemExit('ERROR: {} : {}'.format(ret_code, descr))
+        if self.cache_ttl > 0:
+            self.responses[part] = time(), xml
+        return xml
+
+    def lld(self, part):
+        """
+        Make discovery of MSA part.
+
+        :param part: Name of storage component.
+        :type part: str
+        :return: List with discovery macros of every object.
+        :rtype: list
+        """
+
+        return get_lld(self, part, None, self.show(part))
+
+    def full(self, part, window=None, fields=None, exclude=None, summary=False):
+        """
+        Get full data of MSA part.
+
+        :param part: Name of storage component.
+        :type part: str
+        :param window: Add aggregates of sampled statistics for last 'window' seconds.
+        :type window: Union[int, None]
+        :param fields: Names of fields to keep, all fields if empty.
+        :type fields: Union[list, None]
+        :param exclude: Names of fields to drop.
+        :type exclude: Union[list, None]
+        :param summary: Add aggregates of all objects as 'summary' key.
+        :type summary: bool
+        :return: Data of all found objects as {component_id: {field: value}}.
+        :rtype: dict
+        """
+
+        wanted = make_projection(part, fields, exclude, summary)
+        return get_full_data(self, part, self.sessionkey(), self.show(part), window, wanted, summary)
+
+    def health(self, part, item=None):
+        """
+        Get health status of MSA part objects.
+
+        :param part: Name of storage component.
+        :type part: str
+        :param item: Object id to get status of, all objects if None.
+        :type item: Union[str, None]
+        :return: Health status of the object or dict as {component_id: health} if item isn't given.
+        :rtype: Union[str, dict]
+        """
+
+        # One object of parts except disks and vdisks can't be requested, so all of them are parsed anyway
+        if item is None or part in self.responses or part not in ('vdisks', 'disks'):
+            health_dict = make_health_dict(part, self.show(part))
+            if item is None:
+                return health_dict
+            if item not in health_dict:
+                raise SystemExit("ERROR: No such id: '{}'.".format(item))
+            return health_dict[item]
+        return get_health(self, part, item, self.sessionkey())
+
+
+def start_profiling(mode):
+    """
+    Start CPU or memory profiling of the script run.
+
+    In 'mem' mode the hot-path functions are wrapped to measure memory allocated during each call.
+
+    :param mode: Profiling mode, 'cpu' or 'mem'.
+    :type mode: str
+    :return: Profiler object for 'cpu' mode, dict with per-function memory stats for 'mem' mode.
+    :rtype: Union[cProfile.Profile, dict]
+    """
+
+    if mode == 'cpu':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    phases_mem = {}
+    # Stack of peaks of unfinished calls, nested call moves peak of the outer one
+    call_stack = []
+
+    def trace_phase(name, func):
+        def wrapper(*args, **kwargs):
+            if call_stack:
+                call_stack[-1][1] = max(call_stack[-1][1], tracemalloc.get_traced_memory()[1])
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            call_stack.append([tracemalloc.get_traced_memory()[0], 0])
+            try:
+                return func(*args, **kwargs)
+            finally:
+                start, peak = call_stack.pop()
+                current, last_peak = tracemalloc.get_traced_memory()
+                peak = max(peak, last_peak)
+                if call_stack:
+                    call_stack[-1][1] = max(call_stack[-1][1], peak)
+                stats = phases_mem.setdefault(name, [0, 0, 0])
+                stats[0] += 1
+                stats[1] += current - start
+                stats[2] = max(stats[2], peak - start)
+        return wrapper
+
+    for name in PROFILE_PHASES:
+        if name == 'dumps':
+            json.dumps = trace_phase(name, json.dumps)
+        else:
+            globals()[name] = trace_phase(name, globals()[name])
+    tracemalloc.start(PROFILE_FRAMES)
+    return phases_mem
+
+
+def save_profile(mode, profiler, path):
+    """
+    Stop profiling and write report with hot-path breakdown and top functions (or lines for 'mem' mode).
+
+    :param mode: Profiling mode, 'cpu' or 'mem'.
+    :type mode: str
+    :param profiler: Object returned by start_profiling().
+    :type profiler: Union[cProfile.Profile, dict]
+    :param path: Path to report file.
+    :type path: str
+    :return: None
+    :rtype: None
+    """
+
+    report = StringIO()
+    report.write('zbx-hpmsa {} profile: {}\n\n'.format(mode, ' '.join(sys.argv[1:])))
+    if mode == 'cpu':
+        profiler.disable()
+        stats = pstats.Stats(profiler, stream=report)
+        script_file = query_xmlapi.__code__.co_filename
+        phases_cpu = {}
+        for (file_name, line, func), (prim_calls, calls, own_time, cum_time, callers) in stats.stats.items():
+            if func in PROFILE_PHASES and (file_name == script_file or func == 'dumps' and 'json' in file_name):
+                phase = phases_cpu.setdefault(func, [0, 0.0, 0.0])
+                phase[0] += calls
+                phase[1] += own_time
+                phase[2] += cum_time
+        report.write('{:<40} {:>8} {:>12} {:>12}\n'.format('phase', 'calls', 'own, sec', 'total, sec'))
+        for func, label in PROFILE_PHASES.items():
+            if func in phases_cpu:
+                report.write('{:<40} {:>8} {:>12.4f} {:>12.4f}\n'.format(label, *phases_cpu[func]))
+        report.write('\n')
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+    else:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        report.write('{:<40} {:>8} {:>14} {:>14}\n'.format('phase', 'calls', 'kept, KiB', 'max peak, KiB'))
+        for func, label in PROFILE_PHASES.items():
+            if func in profiler:
+                calls, kept, peak = profiler[func]
+                report.write('{:<40} {:>8} {:>14.1f} {:>14.1f}\n'.format(label, calls, kept / 1024, peak / 1024))
+        report.write('\nTop {} lines by memory kept at exit:\n'.format(PROFILE_TOP))
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+            report.write('{}\n'.format(stat))
+
+    try:
+        with open(path, 'w') as report_file:
+            report_file.write(report.getvalue())
+    except PermissionError:
+        raise SystemExit('ERROR: Cannot save profile report to "{}"'.format(path))
+    print('Profile report saved to "{}"'.format(path), file=sys.stderr)
+
+
+if __name__ == '__main__':
     # Main parser
     main_parser = ArgumentParser(description='Zabbix script for HP MSA XML API.', add_help=True)
     main_parser.add_argument('-a', '--api', type=int, default=2, choices=(1, 2), help='MSA API version (default: 2)')
@@ -876,9 +2580,25 @@ if __name__ == '__main__':
     main_parser.add_argument('-f', '--login-file', nargs=1, type=str, help='Path to file contains login and password')
     main_parser.add_argument('-v', '--version', action='version', version=VERSION, help='Print script version and exit')
     main_parser.add_argument('-s', '--save-xml', type=str, nargs=1, help='Save response from storage as XML file')
-    main_parser.add_argument('-t', '--tmp-dir', type=str, nargs=1, default='/dev/shm/zbx-hpmsa/',
+    main_parser.add_argument('-t', '--tmp-dir', type=str, default='/dev/shm/zbx-hpmsa/',
                              help='Path to temp directory')
     main_parser.add_argument('--ssl', type=str, choices=('direct', 'verify'), help='Use https instead http')
+    main_parser.add_argument('--rate', type=float, default=0,
+                             help='Max requests per second to one MSA, shared by all running copies (default: 0 - no limit)')
+    main_parser.add_argument('--burst', type=int, default=5,
+                             help='Number of requests allowed without waiting when --rate is set (default: 5)')
+    main_parser.add_argument('--show-wait', action='store_true',
+                             help='Print time spent in rate limiter queue to stderr')
+    main_parser.add_argument('--cb-threshold', type=int, default=3,
+                             help='Failed requests in a row after which MSA is not queried for a while (default: 3, 0 - off)')
+    main_parser.add_argument('--cb-cooldown', type=float, default=60,
+                             help='Seconds to fail at once after MSA became unreachable (default: 60)')
+    main_parser.add_argument('--xml-backend', type=str, default='auto', choices=('auto', 'lxml', 'etree'),
+                             help='XML parser (default: auto - lxml if it is installed, standard library otherwise)')
+    main_parser.add_argument('--profile', type=str, choices=('cpu', 'mem'),
+                             help='Profile the run with cProfile or tracemalloc and save report to temp directory')
+    main_parser.add_argument('--ring-size', type=int, default=4096,
+                             help='Number of samples kept for one metric in new ring buffer files (default: 4096)')
 
     # Subparsers
     subparsers = main_parser.add_subparsers(help='Possible options list', dest='command')
@@ -895,79 +2615,207 @@ if __name__ == '__main__':
     lld_parser = subparsers.add_parser('lld', help='Do low-level discovery task')
     lld_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
     lld_parser.add_argument('part', type=str, help='MSA part name', choices=MSA_PARTS)
+    lld_parser.add_argument('--cached', type=int, metavar='SEC',
+                            help='Use result from the result cache if it is not older than SEC seconds')
+    lld_parser.add_argument('--from-snapshot', type=int, metavar='SEC',
+                            help='Read result from prefetched snapshot which must not be older than SEC seconds')
 
     # FULL script command
     full_parser = subparsers.add_parser('full', help='Retrieve full data from MSA')
     full_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
     full_parser.add_argument('part', type=str, help='MSA part name', choices=MSA_PARTS)
+    full_parser.add_argument('--cached', type=int, metavar='SEC',
+                             help='Use result from the result cache if it is not older than SEC seconds')
+    full_parser.add_argument('--from-snapshot', type=int, metavar='SEC',
+                             help='Read result from prefetched snapshot which must not be older than SEC seconds')
+    full_parser.add_argument('--window', type=parse_window,
+                             help='Add min/max/avg/p95 of sampled statistics for time window (e.g. "60s", "5m", "1h")')
+    full_parser.add_argument('--summary', action='store_true',
+                             help='Add "summary" key with cache hit ratios of controllers, disks count by health, '
+                                  'hottest disk and disk groups IOPS, disks also get "iops" and "disk-group" fields')
+    full_parser.add_argument('--fields', type=str, nargs='+', metavar='FIELD',
+                             help='Retrieve only these fields (e.g. "health temperature")')
+    full_parser.add_argument('--exclude', type=str, nargs='+', metavar='FIELD',
+                             help="Don't retrieve these fields")
 
     # ?DELETE v0.7: HEALTH script command (Deprecated? Needn't anymore?)
     health_parser = subparsers.add_parser('health', help='Retrieve health status for one component from MSA')
     health_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
     health_parser.add_argument('part', type=str, help='MSA part name', choices=MSA_PARTS)
     health_parser.add_argument('pid', type=str, help='MSA part pid (e.g. "1.1" for disks)')
+    health_parser.add_argument('--cached', type=int, metavar='SEC',
+                               help='Use result from the result cache if it is not older than SEC seconds')
+    health_parser.add_argument('--from-snapshot', type=int, metavar='SEC',
+                               help='Read result from prefetched snapshot which must not be older than SEC seconds')
+
+    # SCHEDULE script command
+    schedule_parser = subparsers.add_parser('schedule', help='Poll MSA parts with own intervals to the result cache')
+    schedule_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
+    schedule_parser.add_argument('--parts', type=str, nargs='+', default=MSA_PARTS, choices=MSA_PARTS,
+                                 help='MSA parts to poll (default: all)')
+    schedule_parser.add_argument('--health', type=int, default=60,
+                                 help='Health status poll interval in seconds, 0 to disable (default: 60)')
+    schedule_parser.add_argument('--full', type=int, default=300,
+                                 help='Full data (statistics) poll interval in seconds, 0 to disable (default: 300)')
+    schedule_parser.add_argument('--lld', type=int, default=3600,
+                                 help='Discovery poll interval in seconds, 0 to disable (default: 3600)')
+    schedule_parser.add_argument('--spacing', type=float, default=1,
+                                 help='Pause between requests for different parts in seconds (default: 1)')
+    schedule_parser.add_argument('--once', action='store_true', help='Poll due parts one time and exit (for cron)')
+
+    # EVENTS script command
+    events_parser = subparsers.add_parser('events', help='Retrieve events logged since the previous call')
+    events_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
+    events_parser.add_argument('--last', type=int, default=100,
+                               help='Number of events to retrieve on the first call for the MSA (default: 100)')
+
+    # PREFETCH script command
+    prefetch_parser = subparsers.add_parser('prefetch', help='Save results of MSA parts as snapshots (for cron)')
+    prefetch_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
+    prefetch_parser.add_argument('--parts', type=str, nargs='+', default=MSA_PARTS, choices=MSA_PARTS,
+                                 help='MSA parts to prefetch (default: all)')
+    prefetch_parser.add_argument('--commands', type=str, nargs='+', default=('lld', 'full', 'health'),
+                                 choices=('lld', 'full', 'health'), help='Commands to prefetch (default: all)')
+
+    # SAMPLE script command
+    sample_parser = subparsers.add_parser('sample', help='Save current statistics to ring buffers')
+    sample_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
+    sample_parser.add_argument('--parts', type=str, nargs='+', default=('controllers', 'pools', 'ports'),
+                               choices=('controllers', 'pools', 'ports'), help='MSA parts to sample (default: all)')
+    sample_parser.add_argument('--every', type=float, default=0,
+                               help='Repeat sampling every EVERY seconds until stopped (default: 0 - sample once)')
+
+    # Collector nodes options: MSA is polled only by its owner node, the others read its results
+    for cluster_parser in (lld_parser, full_parser, health_parser, schedule_parser, prefetch_parser):
+        cluster_parser.add_argument('--cluster-file', type=str,
+                                    help='Membership file shared by collector nodes, MSA is polled only by its owner '
+                                         'node and the others read its results, so --tmp-dir must be shared too')
+        cluster_parser.add_argument('--node-id', type=str, default=gethostname(),
+                                    help='Id of this collector node (default: hostname)')
+        cluster_parser.add_argument('--node-ttl', type=float, default=60,
+                                    help='Node is considered dead without heartbeat for this seconds, shorter TTL '
+                                         'moves MSAs of dead node to the others sooner, but must be longer than '
+                                         'period of prefetch runs (default: 60)')
 
     args = main_parser.parse_args()
 
-    # ?DELETE in v0.7 and correct make_lld()
-    # Matches between CLI 'show' command args and OBJECT 'name' attribute in XML output.
-    NAMES_MATCH = {
-        'disks': 'drive',
-        'vdisks': 'virtual-disk',
-        'controllers': 'controllers',
-        'enclosures': 'enclosures',
-        'power-supplies': 'power-supplies',
-        'fans': 'fan-details',
-        'ports': 'ports',
-        'pools': 'pools',
-        'disk-groups': 'disk-group',
-        'volumes': 'volume'
-    }
-
-    API_VERSION = args.api
+    RING_SIZE = max(args.ring_size, 1)
+    if args.xml_backend == 'auto':
+        XML_BACKEND = 'lxml' if lxml_etree is not None else 'etree'
+    elif args.xml_backend == 'lxml' and lxml_etree is None:
+        raise SystemExit('ERROR: lxml is not installed, use "--xml-backend etree" or install it.')
+    else:
+        XML_BACKEND = args.xml_backend
     TMP_DIR = args.tmp_dir
-    CACHE_DB = TMP_DIR.rstrip('/') + '/zbx-hpmsa.cache.db'
-
-    if args.command in ('lld', 'full', 'health'):
-        # Set some global variables
-        SAVE_XML = args.save_xml
-        USE_SSL = args.ssl in ('direct', 'verify')
-        VERIFY_SSL = args.ssl == 'verify'
-        MSA_USERNAME = args.username
-        MSA_PASSWORD = args.password
-
-        # (IP, DNS)
-        IS_IP = all(elem.isdigit() for elem in args.msa.split('.'))
-        MSA_CONNECT = args.msa if IS_IP else gethostbyname(args.msa), args.msa
-
-        # Make login hash string
-        if args.login_file is not None:
-            CRED_HASH = make_cred_hash(args.login_file, isfile=True)
-        else:
-            CRED_HASH = make_cred_hash('_'.join([MSA_USERNAME, MSA_PASSWORD]))
-
-        # Getting sessionkey
-        skey = get_skey(MSA_CONNECT, CRED_HASH)
+    CACHE_DB = cache_db_path(TMP_DIR)
+
+    # Profile the rest of the run, report is saved on exit
+    if args.profile is not None:
+        PROFILE_REPORT = os.path.join(TMP_DIR, 'profile_{}_{}_{}.txt'.format(
+            args.command, args.profile, datetime.now().strftime('%Y%m%d-%H%M%S')))
+        atexit.register(save_profile, args.profile, start_profiling(args.profile), PROFILE_REPORT)
+
+    if args.command in ('lld', 'full', 'health', 'schedule', 'sample', 'events', 'prefetch'):
+        # Client keeps connection settings and is passed to module functions
+        client = MSAClient(args.msa, username=args.username, password=args.password, login_file=args.login_file,
+                           api=args.api, ssl=args.ssl, save_xml=args.save_xml, rate=args.rate, burst=args.burst,
+                           cb_threshold=args.cb_threshold, cb_cooldown=args.cb_cooldown, tmp_dir=TMP_DIR, cache_ttl=0)
+
+        # Collector nodes share MSAs with membership file
+        CLUSTER = None
+        if args.command not in ('sample', 'events') and args.cluster_file is not None:
+            CLUSTER = (args.cluster_file, args.node_id, args.node_ttl)
+            if args.command in ('lld', 'full', 'health') and args.cached is None and args.from_snapshot is None:
+                raise SystemExit('ERROR: --cluster-file needs --cached or --from-snapshot to read results of '
+                                 'owner node.')
+
+        if args.command == 'schedule':
+            INTERVALS = {'health': args.health, 'full': args.full, 'lld': args.lld}
+            if all(interval <= 0 for interval in INTERVALS.values()):
+                raise SystemExit('ERROR: All poll intervals are disabled.')
+            run_scheduler(client, client.cred_hash, args.parts, INTERVALS, args.spacing, once=args.once,
+                          cluster=CLUSTER)
+            exit(0)
+        elif args.command == 'sample':
+            while True:
+                started = time()
+                try:
+                    sample_statistics(client, args.parts, client.sessionkey())
+                except SystemExit as e:
+                    if args.every <= 0:
+                        raise
+                    print(e, file=sys.stderr)
+                if args.every <= 0:
+                    exit(0)
+                sleep(max(args.every - (time() - started), 0))
+        elif args.command == 'prefetch':
+            if not is_cluster_owner(client, CLUSTER):
+                exit(0)
+            run_prefetch(client, client.sessionkey(), args.parts, args.commands)
+            exit(0)
+        elif args.command == 'events':
+            print(get_events(client, client.sessionkey(), args.last))
+            exit(0)
+
+        # Trying to use result made by prefetch or scheduler
+        cached = None
+        if args.from_snapshot is not None:
+            cached = read_snapshot(client, args.command, args.part, args.from_snapshot)
+        elif args.cached is not None:
+            cached = get_result(client, args.command, args.part, args.cached)
+
+        # MSA polled by other collector node isn't requested, its results must be read instead
+        if cached is None and not is_cluster_owner(client, CLUSTER, heartbeat=False):
+            raise SystemExit('ERROR: MSA {} is polled by other collector node and there is no fresh result of it, '
+                             'check --cached/--from-snapshot age and scheduler of the owner node.'.format(client.dns))
 
         # Make discovery
         if args.command == 'lld':
-            print(make_lld(MSA_CONNECT, args.part, skey))
+            if cached is None:
+                cached = json.dumps({"data": client.lld(args.part)}, separators=(',', ':'))
+            print(cached)
         # ?DELETE in v0.7: Getting health of one MSA component
         elif args.command == 'health':
-            print(get_health(MSA_CONNECT, args.part, args.pid, skey))
+            if cached is not None:
+                health_dict = json.loads(cached)
+                if args.pid not in health_dict:
+                    raise SystemExit("ERROR: No such id: '{}'.".format(args.pid))
+                print(health_dict[args.pid])
+            else:
+                print(client.health(args.part, args.pid))
         # Getting full components data in JSON
         elif args.command == 'full':
-            print(get_full_json(MSA_CONNECT, args.part, skey))
+            projection = make_projection(args.part, args.fields, args.exclude, args.summary)
+            if cached is None:
+                full_data = client.full(args.part, window=args.window, fields=args.fields, exclude=args.exclude,
+                                        summary=args.summary)
+                print(json.dumps(full_data, separators=(',', ':')))
+            elif projection is not None or args.summary or args.window is not None and args.part in RING_METRICS:
+                # Cached data has all fields, summary is made of them before projection
+                full_data = json.loads(cached)
+                components_summary = make_summary(args.part, full_data) if args.summary else None
+                full_data = filter_fields(full_data, projection)
+                if args.window is not None and args.part in RING_METRICS:
+                    add_window_stats(client, args.part, full_data, args.window, projection)
+                if args.summary:
+                    full_data['summary'] = components_summary
+                print(json.dumps(full_data, separators=(',', ':')))
+            else:
+                print(cached)
+
+        if args.show_wait and client.rate_waited > 0:
+            print('WARNING: Requests were queued by rate limiter for {:.3f} sec.'.format(client.rate_waited),
+                  file=sys.stderr)
     # Preparations tasks
     elif args.command == 'install':
         install_script(TMP_DIR, 'zabbix')
     # Operations with cache
     elif args.command == 'cache':
         if args.show:
-            display_cache()
+            display_cache(CACHE_DB)
         elif args.drop:
-            sql_cmd('DELETE FROM skey_cache;')
+            sql_cmd(CACHE_DB, 'DELETE FROM skey_cache;')
         # Default is --show
         else:
-            display_cache()
+            display_cache(CACHE_DB)
         exit(0)